@@ -1,16 +1,22 @@
-import copy
+import argparse
+import sys
+import time
+from pathlib import Path
 
-from src import Utils, Stats, Rules, WordGuess, Suggestor
+from src import Utils, WordGuess, Suggestor, Index, Session, OpeningBook, Profile, History, SuggestionCache
+from src.Constraints import ContradictionError
 
 import logging
 
 logging.basicConfig(level="INFO")
 log = logging.getLogger()
 WOI = "pious"
+# Fastest the suggestions are redrawn while they improve, in seconds.
+REDRAW_INTERVAL = 0.1
 debug_WOI = True
 
 class Game:
-    def __init__(self, practice: bool = False, remove_previous_wordles: bool = False, remove_plural: bool = False, remove_past_tense: bool = False, remove_un: bool = False):
+    def __init__(self, practice: bool = False, remove_previous_wordles: bool = False, remove_plural: bool = False, remove_past_tense: bool = False, remove_un: bool = False, suggestion_mode: str = "heuristic", opening_book: str = None, hard_mode: bool = False, boards: int = 1, word_length: int = Utils.WORD_LENGTH, processes: int = 1, suggestion_budget: float = None, cache_suggestions: bool = True):
         """ The main game object
 
         Args:
@@ -18,36 +24,82 @@ class Game:
             remove_previous_wordles: if True, do not consider previous wordle words for solutions
             remove_plural: if True, remove all wornds ending in "s", excluding "ss" words
             remove_past_tense: if True, remove all words ending in "ed"
+            suggestion_mode: how the suggestor ranks guesses, one of `Suggestor.MODES`
+            opening_book: path to an opening book built with `python -m src.OpeningBook`, its moves are
+                suggested while the game follows it
+            hard_mode: if True, every guess has to use the hints so far, and only such guesses are suggested,
+                single board only
+            boards: the number of boards played with each guess, ex: 4 for quordle
+            word_length: the number of letters in a word, needs the matching word list in data/
+            processes: worker processes to score guesses on in the entropy and expected_size modes
+            suggestion_budget: if given, quick suggestions are shown right away and improved in place for up to
+                this many seconds
+            cache_suggestions: if True, suggestions are kept in `SuggestionCache.shared_cache`, so reaching
+                the same hints again (in any game) shows them instantly
         """
+        if hard_mode and boards > 1:
+            raise ValueError("Hard mode is only supported on a single board")
 
         self.remove_previous_wordles = remove_previous_wordles
         self.remove_plural = remove_plural
         self.remove_past_tense = remove_past_tense
         self.remove_un = remove_un
         self.practice = practice
-
-        self.rule_maker = WordGuess.GuessRules()
-        self.word_list = self.init_wordlist()
-        self.full_word_list = copy.deepcopy(self.word_list)
-        self.stat_calc = Stats.LetterStats.init_and_calc(self.word_list)
-        self.word_stat_calc = Stats.WordStats(self.stat_calc.letter_prob, self.stat_calc.bigram_prob)
-        self.suggestor = Suggestor.Suggestor()
-        self.unknown_letters = [a for a in "abcdefghijklmnopqrstuvwxyz"]
+        self.word_length = word_length
+        self.suggestion_budget = suggestion_budget
+
+        # All the game logic lives in the session, the game only handles talking to the user.
+        self.session = Session.Session(
+            Session.get_dictionary(remove_previous_wordles=remove_previous_wordles, remove_plural=remove_plural,
+                                   remove_past_tense=remove_past_tense, remove_un=remove_un, length=word_length),
+            Session.get_suggestor(suggestion_mode, word_length, processes), hard_mode=hard_mode,
+            cache=SuggestionCache.shared_cache if cache_suggestions else None)
+        if opening_book is not None:
+            self.load_opening_book(opening_book)
+        self.boards = None
+        if boards > 1:
+            self.boards = Session.MultiSession(boards, self.session.dictionary, self.session.suggestor)
 
         self._play = True
 
+    def load_opening_book(self, path: str) -> None:
+        book = OpeningBook.OpeningBook.load(Path(path))
+        if not book.matches(self.session.dictionary):
+            log.warning(f"Opening book {path} was built for a different word list, not using it")
+            return
+        log.info(f"Using the opening book for {book.opener}")
+        self.session.book = book
+
+    @property
+    def index(self) -> Index.WordIndex:
+        return self.session.dictionary.index
+
+    @property
+    def candidates(self) -> int:
+        """ The bitset of words that are still possible
+        """
+        return self.session.candidates
+
+    @property
+    def unknown_letters(self) -> list[str]:
+        return self.session.unknown_letters
+
+    @property
+    def suggestor(self) -> Suggestor.Suggestor:
+        return self.session.suggestor
+
     def _check_woi(self) -> None:
         """ For debugging, check on the presence of a word in the list.
         """
         if not debug_WOI:
             return
-        print(f"{WOI} in list: {WOI in self.word_list}")
+        print(f"{WOI} in list: {self.index.contains(self.candidates, WOI)}")
 
-    def init_wordlist(self) -> list[str]:
-        """ Initialize the word list
+    @property
+    def word_list(self) -> list[str]:
+        """ The words that are still possible, decoded from the candidate bitset
         """
-        my_word_list = copy.deepcopy(Utils.get_word_list(remove_previous_wordles=self.remove_previous_wordles, remove_plural=self.remove_plural, remove_past_tense=self.remove_past_tense, remove_un=self.remove_un))
-        return my_word_list
+        return list(self.session.remaining())
 
     def get_guess(self) -> WordGuess.WordGuess:
         """ capture a new guess from the user
@@ -58,27 +110,32 @@ class Game:
         """
         return WordGuess.WordGuess()
 
-    def process_guess(self, guess: WordGuess) -> None:
+    def process_guess(self, guess: WordGuess) -> bool:
         """ process the guess.
 
-        Converts the guess into a list of rules and then applies those rules to the current word list
+        Folds the guess into the constraints of every guess so far, and then filters the current word list
+        with those constraints in one pass.
 
         Args:
             guess: the guess to filter the word list with
 
+        Returns:
+            True if the guess was applied, False if it was rejected and has to be entered again
+
         """
-        log.debug('making rules')
-        rules = self.rule_maker.guess_to_rules(guess)
-        self.update_letters(guess)
-        log.debug('done')
+        log.debug('making constraints')
         self._check_woi()
-        self.word_list = Rules.evaluate_rules_in_list(self.word_list, rules)
+        try:
+            self.session.guess(guess.letters, guess.lvals, suggest=False)
+        except ContradictionError as e:
+            log.error(f"Ignoring guess, it contradicts earlier guesses: {e}")
+            return False
+        except ValueError as e:
+            log.error(f"Ignoring guess: {e}")
+            return False
+        log.debug('done: %s', self.session.state)
         self._check_woi()
-
-    def update_letters(self, guess: WordGuess):
-        for letter in guess.letters:
-            if letter in self.unknown_letters:
-                self.unknown_letters.remove(letter)
+        return True
 
     def is_game_won(self):
         """ Checks to see if we've won the game.
@@ -89,14 +146,12 @@ class Game:
             True if won, False otherwise
 
         """
-        if len(self.word_list) == 1:
-            return True
-        return False
+        return self.session.is_won()
 
     def get_winning_word(self) -> str:
         """ Returns the winning word
         """
-        if len(self.word_list) != 1:
+        if not self.is_game_won():
             raise Exception("Game is not won!")
         return self.word_list[0]
 
@@ -113,7 +168,7 @@ class Game:
         if add != "Y":
             return
 
-        if len(self.word_list) == 1:
+        if self.is_game_won():
             word = self.word_list[0]
         else:
             word = input("what was the word?")
@@ -126,7 +181,14 @@ class Game:
         if start_over == "n":
             self._play = False
         else:
-            self.word_list = self.init_wordlist()
+            # pick up any answers added since, by this game or another session
+            History.get_store().refresh()
+            self.session.dictionary = Session.get_dictionary(*self.session.dictionary.flags, length=self.word_length)
+            # a new answer changes the word list when past answers are removed, which the book wasn't built for
+            if self.session.book is not None and not self.session.book.matches(self.session.dictionary):
+                log.warning("The word list changed since the opening book was built, not using it")
+                self.session.book = None
+            self.session.reset()
 
     def win_state(self) -> None:
         """ Actions to perform if the user wins
@@ -156,31 +218,128 @@ class Game:
 
         """
         log.debug("Calculating stats")
-        guess_words, guess_vals = self.suggestor.suggest(self.word_list, self.unknown_letters)
-        log.debug('done')
-        Utils.display_choices(guess_words, guess_vals)
+        if self.suggestion_budget is None:
+            guess_words, guess_vals = self.session.suggest()
+            log.debug('done')
+            Utils.display_choices(guess_words, guess_vals)
+            return
+
+        # On a terminal, show the quick suggestions right away and redraw them as they improve,
+        # otherwise only the last ones are printed.
+        live = sys.stdout.isatty()
+        n_lines = 0
+        last_drawn = None
+        suggestions = drawn = None
+        for suggestions in self.session.iter_suggestions(self.suggestion_budget):
+            if live and (last_drawn is None or time.perf_counter() - last_drawn >= REDRAW_INTERVAL):
+                n_lines = Utils.display_choices(*suggestions, replace=n_lines)
+                last_drawn = time.perf_counter()
+                drawn = suggestions
+        if not live or drawn is not suggestions:
+            Utils.display_choices(*suggestions, replace=n_lines)
 
     def play(self) -> None:
         """ Executes the game
 
         """
+        if self.boards is not None:
+            self.play_boards()
+            return
+
         while self._play:
 
             for i in range(6):
-                log.info(f"{len(self.word_list)} possibilities")
-                guess = self.get_guess()
-                self.process_guess(guess)
+                log.info(f"{self.session.n_remaining} possibilities")
+                # a rejected guess doesn't use up the turn, it's asked for again
+                while not self.process_guess(self.get_guess()):
+                    pass
                 if self.is_game_won():
                     self.win_state()
                     break
                 self.display_word_suggestions()
 
-            if len(self.word_list) > 1:
+            if self.session.n_remaining > 1:
                 self.lose_state()
 
+    def guess_boards(self) -> Session.MultiGuessResult:
+        """ Ask for a guess and the colors of each unsolved board, asking again until the guess is valid on
+        every board, so a rejected guess doesn't use up a turn
+
+        """
+        while True:
+            letters = input("enter guess: ")
+            colors = [None if solved else input(f"enter color for board {board + 1}: ")
+                      for board, solved in enumerate(self.boards.solved)]
+            try:
+                return self.boards.guess(letters, colors)
+            except (ContradictionError, ValueError) as e:
+                log.error(f"Ignoring guess: {e}")
+
+    def play_boards(self) -> None:
+        """ Executes a game on several boards, asking for the colors of each unsolved board after every guess
+
+        """
+        while self._play:
+
+            # quordle gives 9 guesses for 4 boards, octordle 13 for 8
+            for i in range(self.boards.n_boards + 5):
+                log.info(f"{[len(words) for words in self.boards.remaining()]} possibilities")
+                result = self.guess_boards()
+                if result.won:
+                    log.info("Congrats!")
+                    break
+                if result.suggestions:
+                    Utils.display_choices(result.suggestions, result.scores)
+            else:
+                log.info("womp womp")
+
+            start_over = input("Play Again? (Y/n)")
+            if start_over == "n":
+                self._play = False
+            else:
+                self.boards.reset()
+
 
 
 
 if __name__ == "__main__":
-    game = Game(remove_previous_wordles=True,remove_plural=True, remove_un=True)
+    parser = argparse.ArgumentParser(description="Play wordle with suggestions")
+    parser.add_argument("--mode", choices=Suggestor.MODES, default="heuristic", help="how suggestions are ranked")
+    parser.add_argument("--opening-book", default=None, help="an opening book built with `python -m src.OpeningBook`")
+    parser.add_argument("--length", type=int, default=Utils.WORD_LENGTH, choices=Utils.available_lengths(),
+                        help="letters per word, needs the matching word list in data/")
+    parser.add_argument("--boards", type=int, default=1, help="play this many boards at once, ex: 4 for quordle")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="score guesses on this many processes, for big word lists on many cores")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="show quick suggestions right away, improving them for up to this many seconds")
+    parser.add_argument("--no-cache", action="store_true", help="work out every suggestion, even for hints seen before")
+    parser.add_argument("--cache-file", type=Path, default=None,
+                        help="also keep cached suggestions in this SQLite file, shared with other games")
+    parser.add_argument("--hard", action="store_true", help="hard mode, every guess has to use the hints so far")
+    parser.add_argument("--profile", action="store_true", help="time each phase and print a report at the end")
+    parser.add_argument("--profile-output", type=Path, default=None, help="also write the profile metrics to this JSON file")
+    parser.add_argument("--quiet", action="store_true", help="only log warnings and errors")
+    args = parser.parse_args()
+    if args.hard and args.boards > 1:
+        parser.error("--hard is only supported with one board")
+
+    if args.quiet:
+        log.setLevel("WARNING")
+        debug_WOI = False
+    if args.profile:
+        Profile.enable()
+    if args.cache_file:
+        SuggestionCache.shared_cache.spill_to(args.cache_file)
+
+    game = Game(remove_previous_wordles=True,remove_plural=True, remove_un=True, suggestion_mode=args.mode,
+                opening_book=args.opening_book, hard_mode=args.hard, boards=args.boards,
+                word_length=args.length, processes=args.processes, suggestion_budget=args.budget,
+                cache_suggestions=not args.no_cache)
     game.play()
+
+    if args.profile:
+        print(Profile.profiler.report())
+        print(SuggestionCache.shared_cache.report())
+        if args.profile_output:
+            Profile.profiler.dump(args.profile_output)
@@ -0,0 +1,221 @@
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from src import Utils, Stats, Rules, WordGuess, Suggestor, Patterns
+
+log = logging.getLogger()
+
+DEFAULT_HISTORY = Utils.data_dir / "benchmark_history.json"
+DEFAULT_SIZES = (5757, 50000, 200000)
+DEFAULT_THRESHOLD = 0.2
+# Slow downs smaller than this many seconds are timer noise, however large they are relative to the baseline.
+DEFAULT_MIN_DELTA = 0.0005
+SEED = 1234
+
+FLAG_NAMES = ("remove_previous_wordles", "remove_plural", "remove_past_tense", "remove_un")
+
+
+def synthetic_words(size: int, seed: int = SEED) -> list[str]:
+    """ Random five letter "words" drawn with the letter frequencies of the real word list.
+
+    The real word list is used as is when the size matches it.
+    """
+    words = list(Utils.get_words())
+    if size == len(words):
+        return words
+    rng = random.Random(seed)
+    letters = "".join(words)
+    alphabet = sorted(set(letters))
+    weights = [letters.count(l) for l in alphabet]
+    return ["".join(rng.choices(alphabet, weights, k=5)) for _ in range(size)]
+
+
+def realistic_rules(words: list[str], n_guesses: int = 2, seed: int = SEED) -> list:
+    """ The rules from a few guesses against a random answer, as they'd come out of a real game
+    """
+    rng = random.Random(seed)
+    answer = rng.choice(words)
+    rule_maker = WordGuess.GuessRules()
+    rules = []
+    for guess in rng.sample(words, n_guesses):
+        with quiet_output():
+            rules += rule_maker.guess_to_rules(WordGuess.WordGuess(guess, Patterns.score_guess(guess, answer)))
+    return rules
+
+
+@contextlib.contextmanager
+def quiet_output():
+    """ Send anything printed by the code under test to devnull, so the terminal doesn't get timed
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def time_function(func, repeat: int) -> dict:
+    """ Time a function a number of times, returns the min and median in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        with quiet_output():
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {"min": times[0], "median": times[len(times) // 2], "repeat": repeat}
+
+
+def cold_word_list(**kwargs) -> tuple[str, ...]:
+    """ `Utils.get_word_list` without its caches, so the filtering is timed rather than a cache hit
+    """
+    Utils.get_filter_masks.cache_clear()
+    Utils.get_word_list.cache_clear()
+    return Utils.get_word_list(**kwargs)
+
+
+def benchmarks(sizes) -> dict:
+    """ Build every benchmark as {name: function to time}
+    """
+    cases = {}
+    for flags in itertools.product([False, True], repeat=len(FLAG_NAMES)):
+        kwargs = dict(zip(FLAG_NAMES, flags))
+        label = "".join("1" if f else "0" for f in flags)
+        cases[f"get_word_list[{label}]"] = lambda kwargs=kwargs: cold_word_list(**kwargs)
+
+    for size in sizes:
+        words = synthetic_words(size)
+        rules = realistic_rules(words)
+        letter_stats = Stats.LetterStats()
+        word_stats = Stats.WordStats(None, None)
+        suggestor = Suggestor.Suggestor()
+        unknown_letters = list("abcdefghijklmnopqrstuvwxyz")
+        guesses = words[:2000]
+
+        cases[f"evaluate_rules_in_list[{size}]"] = lambda w=words, r=rules: Rules.evaluate_rules_in_list(w, r)
+        cases[f"calc_stats[{size}]"] = lambda w=words, s=letter_stats: s.calc_stats(w)
+        cases[f"calc_in_word_stats[{size}]"] = lambda w=words, s=letter_stats: s.calc_in_word_stats(w)
+        cases[f"suggest[{size}]"] = lambda w=words, s=suggestor: s.suggest(w, unknown_letters)
+        cases[f"find_best_guess[{size}x{len(guesses)}]"] = \
+            lambda w=words, g=guesses, s=word_stats: s.find_best_guess(g, w, quiet=True)
+
+    return cases
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_history(path: Path) -> list:
+    if not path.exists():
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def run(sizes=DEFAULT_SIZES, repeat: int = 5, only: str = None, history_path: Path = DEFAULT_HISTORY) -> dict:
+    """ Run the benchmarks and append the results to the history file
+
+    Args:
+        sizes: dictionary sizes to run the size dependent benchmarks at
+        repeat: how many times to time each benchmark
+        only: a regex, only benchmarks whose name matches are run
+        history_path: the JSON history file to append to
+
+    Returns:
+        the new history entry
+
+    """
+    results = {}
+    for name, func in benchmarks(sizes).items():
+        if only and not re.search(only, name):
+            continue
+        results[name] = time_function(func, repeat)
+        print(f"{name:45} min {results[name]['min'] * 1000:10.3f} ms  "
+              f"median {results[name]['median'] * 1000:10.3f} ms")
+
+    entry = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+             "commit": git_commit(),
+             "python": platform.python_version(),
+             "results": results}
+    history = load_history(history_path)
+    history.append(entry)
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, "w") as f:
+        json.dump(history, f, indent=1)
+    return entry
+
+
+def compare(history_path: Path = DEFAULT_HISTORY, threshold: float = DEFAULT_THRESHOLD, baseline: int = -2,
+            current: int = -1, min_delta: float = DEFAULT_MIN_DELTA) -> list[str]:
+    """ Compare two runs in the history and report the benchmarks that got slower
+
+    Args:
+        history_path: the JSON history file
+        threshold: the fractional slow down of the min time that counts as a regression, 0.2 is 20% slower
+        baseline: index of the run to compare against, defaults to the second to last run
+        current: index of the run to check, defaults to the last run
+        min_delta: the smallest slow down of the min time, in seconds, that counts as a regression, so
+            benchmarks that take microseconds don't flag on noise
+
+    Returns:
+        the names of the benchmarks that regressed
+
+    """
+    history = load_history(history_path)
+    if len(history) < 2:
+        print(f"Need at least two runs in {history_path} to compare")
+        return []
+
+    old, new = history[baseline], history[current]
+    print(f"comparing {new['commit']} ({new['timestamp']}) against {old['commit']} ({old['timestamp']})")
+    regressions = []
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        ratio = result["min"] / old["results"][name]["min"]
+        flag = ""
+        if ratio > 1 + threshold and result["min"] - old["results"][name]["min"] > min_delta:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:45} {old['results'][name]['min'] * 1000:10.3f} -> {result['min'] * 1000:10.3f} ms "
+              f"({ratio:6.2f}x){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the hot paths and track regressions")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and append to the history")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--only", default=None, help="regex of benchmark names to run")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two runs in the history")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.add_argument("--baseline", type=int, default=-2, help="index of the run to compare against")
+    compare_parser.add_argument("--current", type=int, default=-1, help="index of the run to check")
+    compare_parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA,
+                                help="smallest slow down in seconds that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args.sizes, args.repeat, args.only, args.history)
+    else:
+        sys.exit(1 if compare(args.history, args.threshold, args.baseline, args.current, args.min_delta) else 0)
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from functools import cache, cached_property
+from pathlib import Path
+
+import numpy as np
+
+from src import Utils, Stats, Index
+
+log = logging.getLogger()
+
+
+# Bump this when the layout of the compiled files changes, so old ones get rebuilt.
+FORMAT_VERSION = 2
+
+# Words converted to arrays at once while compiling, so only the arrays (not the words) of a big source are held.
+COMPILE_CHUNK_SIZE = 100_000
+
+
+def source_stamp(source: Path, length: int = Utils.WORD_LENGTH) -> dict:
+    """ What the compiled files were built from, if any of this changes they are rebuilt
+    """
+    stat = Path(source).stat()
+    return {"source": str(Path(source).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "length": length,
+            "version": FORMAT_VERSION}
+
+
+def artifact_paths(source: Path, length: int = Utils.WORD_LENGTH) -> dict[str, Path]:
+    """ The compiled files of a source, named after a hash of its full path, so sources that share a file
+    name (ex: words.txt in two directories, or c.txt.gz and c.txt.bz2) never share files
+    """
+    source = Path(source)
+    source_hash = hashlib.sha1(str(source.resolve()).encode()).hexdigest()[:12]
+    stem = f"{source.stem}-{source_hash}.{length}"
+    return {"meta": Utils.cache_dir / f"{stem}.meta.json",
+            "letters": Utils.cache_dir / f"{stem}.letters.npy",
+            "counts": Utils.cache_dir / f"{stem}.counts.npy",
+            "index": Utils.cache_dir / f"{stem}.index.npy"}
+
+
+@dataclass
+class CompiledWords:
+    """ A word list compiled into arrays, loaded memory mapped.
+
+    - letters: (N x word length) uint8 letter array, one row per word
+    - counts: (N x 26) uint8 letter count array
+    - packed_index: the bitsets of `Index.WordIndex`, packed
+    - letter_prob / bigram_prob / positional_prob: the `Stats.LetterStats` of the whole list
+
+    """
+    letters: np.ndarray
+    counts: np.ndarray
+    packed_index: np.ndarray
+    letter_prob: dict
+    bigram_prob: dict
+    positional_prob: list
+
+    @cached_property
+    def words(self) -> tuple[str, ...]:
+        """ The words, decoded from the letter array
+        """
+        length = self.letters.shape[1]
+        joined = (np.asarray(self.letters) + ord("a")).astype(np.uint8).tobytes().decode("ascii")
+        return tuple(joined[i:i + length] for i in range(0, len(joined), length))
+
+    @cached_property
+    def index(self) -> "Index.WordIndex":
+        return Index.WordIndex(self.words, self.letters, self.counts, packed=self.packed_index)
+
+
+def _save_array(path: Path, array: np.ndarray) -> None:
+    with Utils.atomic_write(path, "wb") as f:
+        np.save(f, array)
+
+
+def compile_words(source: Path, length: int = Utils.WORD_LENGTH) -> None:
+    """ Compile a word source into the files loaded by `load_compiled`
+
+    The source is streamed (see `Utils.stream_words`): it can be plain text, gzip or bz2, of any size,
+    and is lowercased, filtered to `length` letter words and deduplicated on the way in.
+    Words are converted to arrays a chunk at a time, so only the compact arrays are ever held in memory.
+
+    Args:
+        source: the word source to compile
+        length: the word length to keep
+
+    """
+    letter_chunks, count_chunks = [], []
+    positional = np.zeros((length, 26), dtype=np.int64)
+    bigram_counts = np.zeros((26, 26), dtype=np.int64)
+    for words in Utils.batched(Utils.stream_words(source, length=length), COMPILE_CHUNK_SIZE):
+        letters = Utils.words_to_array(words, length)
+        letter_chunks.append(letters)
+        count_chunks.append(Utils.letter_counts(letters))
+        chunk_positional, chunk_bigrams = Stats.LetterStats.count_letters(letters)
+        positional += chunk_positional
+        bigram_counts += chunk_bigrams
+
+    letters = np.concatenate(letter_chunks) if letter_chunks else np.zeros((0, length), dtype=np.uint8)
+    counts = np.concatenate(count_chunks) if count_chunks else np.zeros((0, 26), dtype=np.uint8)
+    del letter_chunks, count_chunks
+    n_words = letters.shape[0]
+    log.info(f"Compiling {n_words} words from {source}")
+
+    stats = Stats.LetterStats()
+    stats.calc_stats_from_counts(positional, bigram_counts, n_words)
+
+    paths = artifact_paths(source, length)
+    _save_array(paths["letters"], letters)
+    _save_array(paths["counts"], counts)
+    _save_array(paths["index"], Index.pack_index(letters, counts))
+
+    # The meta file is written last, so the arrays are only ever used once they are all complete.
+    meta = {"stamp": source_stamp(source, length), "n_words": n_words,
+            "letter_prob": stats.letter_prob, "bigram_prob": stats.bigram_prob,
+            "positional_prob": stats.positional_prob.tolist()}
+    with Utils.atomic_write(paths["meta"]) as f:
+        json.dump(meta, f)
+
+
+def load_compiled(source: Path, length: int = Utils.WORD_LENGTH) -> CompiledWords:
+    """ Load the compiled form of a word list, compiling it first if it is missing or the source has changed
+
+    Args:
+        source: the word source (plain text, gzip or bz2)
+        length: the word length to keep from the source
+
+    Returns:
+        the compiled words, with the arrays memory mapped
+
+    """
+    paths = artifact_paths(source, length)
+    meta = None
+    if paths["meta"].exists():
+        with open(paths["meta"], "r") as f:
+            meta = json.load(f)
+
+    if meta is None or meta["stamp"] != source_stamp(source, length):
+        compile_words(source, length)
+        with open(paths["meta"], "r") as f:
+            meta = json.load(f)
+
+    return CompiledWords(np.load(paths["letters"], mmap_mode="r"),
+                         np.load(paths["counts"], mmap_mode="r"),
+                         np.load(paths["index"], mmap_mode="r"),
+                         meta["letter_prob"], meta["bigram_prob"], meta["positional_prob"])
+
+
+@cache
+def get_compiled_words(length: int = Utils.WORD_LENGTH) -> CompiledWords:
+    """ The compiled word list of a word length, five letters by default
+    """
+    return load_compiled(Utils.word_list_path(length), length)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile word lists (plain text, .gz or .bz2) into memory mappable arrays")
+    parser.add_argument("sources", type=Path, nargs="*", default=[Utils.word_list_path()])
+    parser.add_argument("--length", type=int, default=Utils.WORD_LENGTH, help="the word length to keep")
+    args = parser.parse_args()
+    for source in args.sources:
+        compile_words(source, args.length)
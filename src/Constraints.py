@@ -0,0 +1,226 @@
+import logging
+import re
+from dataclasses import dataclass, replace
+from itertools import compress
+
+import numpy as np
+
+from src import Utils, WordGuess
+from src.Utils import ALPHABET
+
+log = logging.getLogger()
+
+WORD_LENGTH = Utils.WORD_LENGTH
+
+
+class ContradictionError(Exception):
+    """ Raised when a guess is inconsistent with the guesses that came before it.
+
+    This almost always means a color was entered incorrectly.
+    """
+
+
+@dataclass(frozen=True)
+class ConstraintState:
+    """ Everything the guesses so far have told us about the word, in one canonical form.
+
+    Rather than keeping a pile of rules from every guess, each guess is folded into:
+        - greens: the known letter at each position, or None
+        - forbidden: the letters known NOT to be at each position
+        - min_counts: the least number of times each letter appears (26 entries, a-z)
+        - max_counts: the most number of times each letter appears (26 entries, a-z)
+
+    Redundant information (ex: a forbidden letter at a position that is already green) is dropped,
+    so two different guess histories that tell us the same thing produce equal states.
+    The state is immutable and hashable, so it can be used as a cache key.
+
+    The defaults are for five letter words, use `empty` for other lengths.
+
+    """
+    greens: tuple = (None,) * WORD_LENGTH
+    forbidden: tuple = (frozenset(),) * WORD_LENGTH
+    min_counts: tuple = (0,) * 26
+    max_counts: tuple = (WORD_LENGTH,) * 26
+
+    @classmethod
+    def empty(cls, length: int = WORD_LENGTH) -> "ConstraintState":
+        """ The state before any guesses, for words of a given length
+        """
+        return cls((None,) * length, (frozenset(),) * length, (0,) * 26, (length,) * 26)
+
+    @classmethod
+    def from_guesses(cls, guesses, length: int = WORD_LENGTH) -> "ConstraintState":
+        """ Build a state from an iterable of (letters, colors) pairs
+        """
+        state = cls.empty(length)
+        for letters, colors in guesses:
+            state = state.add_guess(letters, colors)
+        return state
+
+    @property
+    def length(self) -> int:
+        return len(self.greens)
+
+    def add_guess(self, letters: str, colors: str) -> "ConstraintState":
+        """ Fold one guess into the state.
+
+        Args:
+            letters: the guessed word
+            colors: the tile colors of the guess, ex: "bgybb"
+
+        Returns:
+            a new state with the guess included
+
+        Raises:
+            ContradictionError: if the guess contradicts the current state
+
+        """
+        letters = letters.lower()
+        if len(letters) != len(self.greens) or len(colors) != len(letters):
+            raise ContradictionError(f"guess {letters} / {colors} is not {len(self.greens)} letters long")
+
+        greens = list(self.greens)
+        forbidden = [set(f) for f in self.forbidden]
+        min_counts = list(self.min_counts)
+        max_counts = list(self.max_counts)
+
+        for position, (letter, color) in enumerate(zip(letters, colors)):
+            if color == WordGuess.Code.correct:
+                if greens[position] not in (None, letter):
+                    raise ContradictionError(f"position {position} can't be both {greens[position]} and {letter}")
+                greens[position] = letter
+            else:
+                # A yellow or black tile both mean this letter is not here.
+                forbidden[position].add(letter)
+
+        for letter in set(letters):
+            index = ALPHABET.index(letter)
+            tiles = [c for ltr, c in zip(letters, colors) if ltr == letter]
+            n_found = sum(c in (WordGuess.Code.correct, WordGuess.Code.present) for c in tiles)
+            min_counts[index] = max(min_counts[index], n_found)
+            # A black tile means we found every copy of this letter.
+            if WordGuess.Code.incorrect in tiles:
+                max_counts[index] = min(max_counts[index], n_found)
+
+        return self._canonical(greens, forbidden, min_counts, max_counts)
+
+    def _canonical(self, greens, forbidden, min_counts, max_counts) -> "ConstraintState":
+        """ Check a candidate state for contradictions and drop redundant information
+        """
+        length = len(greens)
+        for position, letter in enumerate(greens):
+            if letter is None:
+                continue
+            if letter in forbidden[position]:
+                raise ContradictionError(f"{letter} can't be both at and not at position {position}")
+            index = ALPHABET.index(letter)
+            min_counts[index] = max(min_counts[index], greens.count(letter))
+
+        total = sum(min_counts)
+        if total > length:
+            raise ContradictionError(f"at least {total} letters are needed in a {length} letter word")
+
+        for index in range(26):
+            # Every other letter takes up space, so this one can only fill what's left.
+            max_counts[index] = min(max_counts[index], length - (total - min_counts[index]))
+            if min_counts[index] > max_counts[index]:
+                raise ContradictionError(f"{ALPHABET[index]} can't appear at least {min_counts[index]} "
+                                         f"and at most {max_counts[index]} times")
+
+        for position in range(length):
+            if greens[position] is not None:
+                forbidden[position] = set()
+                continue
+            # A letter that has already used up all its copies on greens can't be anywhere else.
+            forbidden[position] = {letter for letter in forbidden[position]
+                                   if max_counts[ALPHABET.index(letter)] > greens.count(letter)}
+
+        return replace(self,
+                       greens=tuple(greens),
+                       forbidden=tuple(frozenset(f) for f in forbidden),
+                       min_counts=tuple(min_counts),
+                       max_counts=tuple(max_counts))
+
+    def allowed_letters(self, position: int) -> str:
+        """ Returns the letters that may still be at a position
+        """
+        if self.greens[position] is not None:
+            return self.greens[position]
+        return "".join(letter for index, letter in enumerate(ALPHABET)
+                       if self.max_counts[index] > self.greens.count(letter)
+                       and letter not in self.forbidden[position])
+
+    def matches(self, word: str) -> bool:
+        """ Test a word against every constraint in a single pass
+        """
+        for position, letter in enumerate(word):
+            green = self.greens[position]
+            if green is not None and letter != green:
+                return False
+            if letter in self.forbidden[position]:
+                return False
+        for index, letter in enumerate(ALPHABET):
+            if self.min_counts[index] == 0 and self.max_counts[index] >= len(word):
+                continue
+            if not self.min_counts[index] <= word.count(letter) <= self.max_counts[index]:
+                return False
+        return True
+
+    def to_regex(self) -> re.Pattern:
+        """ Compile the state into a single regular expression that only matches allowed words
+        """
+        lookaheads = []
+        for index, letter in enumerate(ALPHABET):
+            if self.min_counts[index]:
+                lookaheads.append(f"(?=(?:[^{letter}]*{letter}){{{self.min_counts[index]}}})")
+            if self.max_counts[index] < len(self.greens):
+                lookaheads.append(f"(?!(?:[^{letter}]*{letter}){{{self.max_counts[index] + 1}}})")
+        # an empty character class isn't valid, and (?!) never matches, which is what we want there.
+        positions = [f"[{allowed}]" if allowed else "(?!)"
+                     for allowed in map(self.allowed_letters, range(len(self.greens)))]
+        return re.compile("^" + "".join(lookaheads) + "".join(positions) + "$")
+
+    def get_mask(self, letters: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """ Evaluate the state on every word at once.
+
+        Args:
+            letters: (N x word length) letter array of the words, from `Utils.words_to_array`
+            counts: (N x 26) letter count array of the words, from `Utils.letter_counts`
+
+        Returns:
+            a boolean mask of the words that satisfy the state
+
+        """
+        allowed = np.zeros((len(self.greens), 26), dtype=bool)
+        for position in range(len(self.greens)):
+            allowed[position, [ALPHABET.index(l) for l in self.allowed_letters(position)]] = True
+        mask = allowed[np.arange(len(self.greens)), letters].all(axis=1)
+        mask &= (counts >= np.array(self.min_counts, dtype=np.uint8)).all(axis=1)
+        mask &= (counts <= np.array(self.max_counts, dtype=np.uint8)).all(axis=1)
+        return mask
+
+    def filter(self, word_list: list[str]) -> list[str]:
+        """ Returns only the words in the list that satisfy the state, in a single sweep
+        """
+        letters = Utils.words_to_array(word_list, self.length)
+        mask = self.get_mask(letters, Utils.letter_counts(letters))
+        return list(compress(word_list, mask))
+
+    def key(self) -> str:
+        """ The state as a short string, the same in every process (unlike `hash`, which is salted per process),
+        so it can be a key on disk.  Equal states give equal keys.
+
+        ex: "c....|,o,l,,|a0-0 b0-2 c1-3 ..." for the greens, the letters forbidden at each position,
+        and the min-max counts of every letter that's known something about
+        """
+        greens = "".join(g or "." for g in self.greens)
+        forbidden = ",".join("".join(sorted(f)) for f in self.forbidden)
+        counts = " ".join(f"{letter}{n_min}-{n_max}" for letter, n_min, n_max
+                          in zip(ALPHABET, self.min_counts, self.max_counts) if (n_min, n_max) != (0, self.length))
+        return f"{greens}|{forbidden}|{counts}"
+
+    def __str__(self):
+        greens = "".join(g or "." for g in self.greens)
+        present = {ALPHABET[i]: n for i, n in enumerate(self.min_counts) if n}
+        absent = "".join(ALPHABET[i] for i, n in enumerate(self.max_counts) if n == 0)
+        return f"greens: {greens} present: {present} absent: {absent}"
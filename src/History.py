@@ -0,0 +1,181 @@
+import datetime
+import logging
+import os
+import sqlite3
+import sys
+from functools import cache
+from pathlib import Path
+
+from src import Utils
+
+log = logging.getLogger()
+
+DEFAULT_PATH = Utils.data_dir / "solutions.db"
+SEED_PATH = Utils.data_dir / "updated_words.txt"
+
+# How long a writer waits for another session's write to finish before giving up.
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS solutions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    word TEXT NOT NULL UNIQUE,
+    date TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SolutionStore:
+    """ The past wordle answers, with the date they were the answer when it's known, in a small SQLite database.
+
+    Words are unique and indexed, so membership is a single lookup, and every write is its own transaction,
+    so any number of sessions (or processes) can add answers at once.  Adding an answer clears every cached
+    word list derived from the answers (see `invalidate_caches`).
+
+    The store is seeded from `data/updated_words.txt`, and picks up any words added to that file since.
+
+    ex:
+        store = get_store()
+        store.add("pious", "2022-06-01")
+        "pious" in store
+
+    """
+
+    def __init__(self, path: Path = DEFAULT_PATH, seed: Path = SEED_PATH):
+        self.path = Path(path)
+        self.seed = Path(seed) if seed is not None else None
+        self._connection = None
+        self._pid = None
+        self._data_version = None
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+        if self.seed is not None and self.seed.exists():
+            self.migrate(self.seed)
+
+    def connection(self) -> sqlite3.Connection:
+        """ The connection for this process, a forked process gets its own rather than sharing the parent's
+        """
+        if self._connection is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            # readers don't block the writer, and the writer doesn't block readers
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+            # the baseline for `refresh`, data_version is only comparable on the same connection
+            self._data_version = self._read_data_version()
+        return self._connection
+
+    def _read_data_version(self) -> int:
+        return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def migrate(self, source: Path) -> int:
+        """ Add the words of a text word list, ex: the old updated_words.txt.  The file is only read again
+        when it changes.
+
+        Returns:
+            the number of new words
+
+        """
+        stat = Path(source).stat()
+        stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+        key = f"seed:{Path(source).name}"
+        connection = self.connection()
+        row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] == stamp:
+            return 0
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO solutions (word) VALUES (?)",
+                                   ((word,) for word in Utils.stream_words(source)))
+            added = connection.total_changes - before
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, stamp))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        if added:
+            log.info(f"Added {added} past answers from {source}")
+            invalidate_caches()
+        return added
+
+    def add(self, word: str, date: str = None) -> bool:
+        """ Record a past answer.
+
+        Args:
+            word: the answer
+            date: the day it was the answer, as YYYY-MM-DD, defaults to today
+
+        Returns:
+            True if the word is new, False if it was already in the store
+
+        """
+        date = date or datetime.date.today().isoformat()
+        cursor = self.connection().execute("INSERT OR IGNORE INTO solutions (word, date) VALUES (?, ?)",
+                                           (word.lower(), date))
+        if cursor.rowcount == 0:
+            return False
+        invalidate_caches()
+        return True
+
+    def refresh(self) -> bool:
+        """ Clear the cached word lists if another session changed the store since the last call
+
+        Returns:
+            True if the store changed
+
+        """
+        self.connection()
+        version = self._read_data_version()
+        changed = version != self._data_version
+        self._data_version = version
+        if changed:
+            invalidate_caches()
+        return changed
+
+    def __contains__(self, word: str) -> bool:
+        return self.connection().execute("SELECT 1 FROM solutions WHERE word = ?",
+                                         (word.lower(),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def date(self, word: str) -> str:
+        """ The date a word was the answer, or None if it's not known
+        """
+        row = self.connection().execute("SELECT date FROM solutions WHERE word = ?", (word.lower(),)).fetchone()
+        return None if row is None else row[0]
+
+    def words(self) -> list[str]:
+        """ Every past answer, in the order they were added
+        """
+        connection = self.connection()
+        # read before the words, so a change made in between is still seen by the next `refresh`
+        self._data_version = self._read_data_version()
+        return [row[0] for row in connection.execute("SELECT word FROM solutions ORDER BY id")]
+
+
+@cache
+def get_store() -> SolutionStore:
+    """ The shared store of past answers
+    """
+    return SolutionStore()
+
+
+def invalidate_caches() -> None:
+    """ Clear every cached word list derived from the past answers, so the next use sees the new answers.
+
+    Modules that aren't imported yet have nothing cached, and aren't imported just to clear them.
+    """
+    Utils.get_wordles.cache_clear()
+    Utils.get_filter_masks.cache_clear()
+    Utils.get_word_list.cache_clear()
+    for module, name in (("src.Index", "get_word_list_bits"), ("src.Session", "get_dictionary")):
+        if module in sys.modules:
+            getattr(sys.modules[module], name).cache_clear()
@@ -0,0 +1,196 @@
+import logging
+from functools import cache, cached_property
+
+import numpy as np
+
+from src import Utils, Compile
+from src.Constraints import ConstraintState
+from src.Utils import ALPHABET
+
+log = logging.getLogger()
+
+
+def mask_to_bits(mask: np.ndarray) -> int:
+    """ Pack a boolean mask into a python int, bit i is set if mask[i] is True
+    """
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+def bits_to_mask(bits: int, n_words: int) -> np.ndarray:
+    """ Unpack a python int back into a boolean mask of length n_words
+    """
+    packed = np.frombuffer(bits.to_bytes((n_words + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(packed, bitorder="little")[:n_words].astype(bool)
+
+
+def count(bits: int) -> int:
+    """ Number of words in a bitset
+    """
+    return bin(bits).count("1")
+
+
+def index_keys(length: int) -> list[tuple[str, str, int]]:
+    """ Every (table, letter, position or count) in the index of words of a length, in a fixed order
+    """
+    keys = []
+    for letter in ALPHABET:
+        keys += [("at", letter, position) for position in range(length)]
+        for n in range(length + 1):
+            keys += [("exact", letter, n), ("at_least", letter, n)]
+    return keys
+
+
+def key_masks(letters: np.ndarray, counts: np.ndarray):
+    """ Yields the boolean mask of words for each key, in the order of `index_keys`
+    """
+    for table, letter, n in index_keys(letters.shape[1]):
+        index = ALPHABET.index(letter)
+        if table == "at":
+            yield letters[:, n] == index
+        elif table == "exact":
+            yield counts[:, index] == n
+        else:
+            yield counts[:, index] >= n
+
+
+def pack_index(letters: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """ The packed bitsets of `WordIndex.to_packed`, built straight from the letter and count arrays
+    one key at a time, without the word list or the python int bitsets
+    """
+    return np.stack([np.packbits(mask, bitorder="little") for mask in key_masks(letters, counts)])
+
+
+class WordIndex:
+    """ An inverted index from letter facts to the set of words they are true for.
+
+    Each set of words is a bitset (a python int, where bit i is word i), for:
+        - at[(letter, position)]: words with the letter at that position
+        - exact[(letter, n)]: words with exactly n of the letter
+        - at_least[(letter, n)]: words with n or more of the letter
+
+    Narrowing down words is then a handful of AND / AND NOT operations on ints
+    instead of a pass over the word list.
+
+    """
+
+    def __init__(self, words, letters: np.ndarray = None, counts: np.ndarray = None, packed: np.ndarray = None):
+        """
+        Args:
+            words: the words to index
+            letters: (N x word length) letter array of the words, computed from the words if not given
+            counts: (N x 26) letter count array of the words, computed from the letters if not given
+            packed: the bitsets from `to_packed`, so they don't have to be rebuilt
+        """
+        self.words = tuple(words)
+        self.word_ids = {w: i for i, w in enumerate(self.words)}
+        self.all = (1 << len(self.words)) - 1
+
+        if letters is None:
+            letters = Utils.words_to_array(self.words)
+        if counts is None:
+            counts = Utils.letter_counts(letters)
+        self.letters = letters
+        self.counts = counts
+        self.length = letters.shape[1]
+
+        if packed is not None:
+            bitsets = [int.from_bytes(row.tobytes(), "little") for row in packed]
+        else:
+            bitsets = [mask_to_bits(mask) for mask in self.key_masks(letters, counts)]
+
+        self.at = {}
+        self.exact = {}
+        self.at_least = {}
+        tables = {"at": self.at, "exact": self.exact, "at_least": self.at_least}
+        for (table, letter, n), bits in zip(self.keys(), bitsets):
+            tables[table][(letter, n)] = bits
+
+    @cached_property
+    def present(self) -> np.ndarray:
+        """ (N x 26) boolean array, [i, j] is True if letter j is in word i
+        """
+        return self.counts > 0
+
+    def keys(self) -> list[tuple[str, str, int]]:
+        """ Every (table, letter, position or count) in the index, in a fixed order
+        """
+        return index_keys(self.length)
+
+    def key_masks(self, letters: np.ndarray, counts: np.ndarray):
+        """ Yields the boolean mask of words for each key, in the order of `keys`
+        """
+        return key_masks(letters, counts)
+
+    def to_packed(self) -> np.ndarray:
+        """ Every bitset in the index as a (keys x bytes) uint8 array, in the order of `keys`, for saving
+        """
+        n_bytes = (len(self.words) + 7) // 8
+        tables = {"at": self.at, "exact": self.exact, "at_least": self.at_least}
+        rows = [tables[table][(letter, n)].to_bytes(n_bytes, "little") for table, letter, n in self.keys()]
+        return np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), n_bytes)
+
+    def bits_for(self, words) -> int:
+        """ Returns the bitset of a list of words
+        """
+        mask = np.zeros(len(self.words), dtype=bool)
+        mask[np.fromiter((self.word_ids[w] for w in words), dtype=np.intp)] = True
+        return mask_to_bits(mask)
+
+    def decode(self, bits: int) -> list[str]:
+        """ Returns the words in a bitset, in index order
+        """
+        return [self.words[i] for i in np.flatnonzero(bits_to_mask(bits, len(self.words)))]
+
+    def contains(self, bits: int, word: str) -> bool:
+        word_id = self.word_ids.get(word)
+        return word_id is not None and bool(bits >> word_id & 1)
+
+    def apply(self, state: ConstraintState, bits: int = None) -> int:
+        """ Narrow a bitset down to the words that satisfy a constraint state
+
+        Args:
+            state: the constraints to apply
+            bits: the words to narrow down, defaults to every word in the index
+
+        Returns:
+            the bitset of words that satisfy the state
+
+        """
+        if bits is None:
+            bits = self.all
+
+        for position, green in enumerate(state.greens):
+            if green is not None:
+                bits &= self.at[(green, position)]
+            for letter in state.forbidden[position]:
+                bits &= ~self.at[(letter, position)]
+
+        for index, letter in enumerate(ALPHABET):
+            n_min, n_max = state.min_counts[index], state.max_counts[index]
+            if n_min == n_max:
+                bits &= self.exact[(letter, n_min)]
+                continue
+            if n_min > 0:
+                bits &= self.at_least[(letter, n_min)]
+            if n_max < self.length:
+                bits &= ~self.at_least[(letter, n_max + 1)]
+
+        return bits
+
+
+@cache
+def get_index(length: int = Utils.WORD_LENGTH) -> WordIndex:
+    """ The shared index over every word of a length (five letters by default), loaded from the compiled word list
+    """
+    return Compile.get_compiled_words(length).index
+
+
+@cache
+def get_word_list_bits(remove_previous_wordles=False, remove_plural=False, remove_past_tense=False, remove_un=False,
+                       length: int = Utils.WORD_LENGTH) -> int:
+    """ The bitset of `Utils.get_word_list` with the same filters, cached for each combination of filters
+    """
+    return get_index(length).bits_for(Utils.get_word_list(remove_previous_wordles=remove_previous_wordles,
+                                                          remove_plural=remove_plural,
+                                                          remove_past_tense=remove_past_tense,
+                                                          remove_un=remove_un, length=length))
@@ -0,0 +1,139 @@
+import argparse
+import gzip
+import json
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from src import Utils, Patterns, Session, Suggestor
+from src.Utils import ALPHABET
+
+log = logging.getLogger()
+
+
+
+@dataclass
+class OpeningBook:
+    """ The precomputed first few moves of every game for a fixed opener.
+
+    `moves` maps the feedback patterns seen so far (as a tuple of pattern codes) to the next guess,
+    the empty tuple maps to the opener. As long as every guess so far followed the book,
+    the next move is a dict lookup.
+
+    """
+    opener: str
+    moves: dict
+    mode: str
+    flags: tuple
+    word_list_hash: str
+
+    def lookup(self, history) -> str:
+        """ The next guess, or None if the game has left the book
+
+        Args:
+            history: the (letters, colors) of every guess so far
+
+        Returns:
+            the next guess from the book, or None
+
+        """
+        path = ()
+        for letters, colors in history:
+            if self.moves.get(path) != letters:
+                return None
+            path += (Patterns.colors_to_pattern(colors),)
+        return self.moves.get(path)
+
+    def matches(self, dictionary: Session.Dictionary) -> bool:
+        """ True if the book was built for the same word list as the dictionary
+        """
+        return (tuple(dictionary.flags) == self.flags
+                and Utils.word_list_hash(dictionary.index.decode(dictionary.start_candidates)) == self.word_list_hash)
+
+    def save(self, path: Path) -> None:
+        data = {"opener": self.opener, "mode": self.mode, "flags": list(self.flags),
+                "word_list_hash": self.word_list_hash,
+                "moves": {",".join(map(str, p)): guess for p, guess in self.moves.items()}}
+        with Utils.atomic_write(path, "wb") as raw, gzip.open(raw, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: Path) -> "OpeningBook":
+        with gzip.open(path, "rt") as f:
+            data = json.load(f)
+        moves = {tuple(int(p) for p in key.split(",") if p): guess for key, guess in data["moves"].items()}
+        return cls(data["opener"], moves, data["mode"], tuple(data["flags"]), data["word_list_hash"])
+
+
+def default_path(opener: str, mode: str, flags: tuple) -> Path:
+    flag_key = "".join("1" if f else "0" for f in flags)
+    return Utils.cache_dir / f"book-{opener}-{mode}-{flag_key}.json.gz"
+
+
+def build(opener: str, dictionary: Session.Dictionary = None, mode: str = "entropy", depth: int = 3) -> OpeningBook:
+    """ Build the decision tree of the first `depth` guesses, starting with the opener.
+
+    Every feedback pattern the opener can get leads to a set of remaining words, the suggestor picks the
+    guess for that set, and so on for each of its patterns until `depth` guesses have been made.
+
+    Args:
+        opener: the first guess
+        dictionary: the word list to play with, defaults to the unfiltered one
+        mode: the `Suggestor` mode that picks each guess
+        depth: the number of guesses in the book, including the opener
+
+    Returns:
+        the opening book
+
+    """
+    dictionary = dictionary or Session.get_dictionary()
+    suggestor = Suggestor.Suggestor(mode, length=dictionary.length)
+    pattern_matrix = suggestor.patterns
+    start_words = dictionary.index.decode(dictionary.start_candidates)
+
+    moves = {(): opener}
+    # (patterns so far, next guess, remaining words, letters not guessed yet)
+    frontier = [((), opener, start_words, list(ALPHABET))]
+    for _ in range(depth - 1):
+        next_frontier = []
+        for path, guess, words, unknown_letters in frontier:
+            unknown_letters = [l for l in unknown_letters if l not in guess]
+            codes = pattern_matrix.block(pattern_matrix.guess_index[guess], pattern_matrix.answer_ids(words))
+            for pattern in np.unique(codes):
+                if pattern == pattern_matrix.all_correct:
+                    continue
+                part = [w for w, code in zip(words, codes) if code == pattern]
+                if len(part) == 1:
+                    next_guess = part[0]
+                else:
+                    suggestions, _ = suggestor.suggest(part, unknown_letters)
+                    next_guess = suggestions[-1]
+                moves[path + (int(pattern),)] = next_guess
+                next_frontier.append((path + (int(pattern),), next_guess, part, unknown_letters))
+        frontier = next_frontier
+
+    return OpeningBook(opener, moves, mode, tuple(dictionary.flags), Utils.word_list_hash(start_words))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the opening book for a first guess")
+    parser.add_argument("opener")
+    parser.add_argument("--mode", choices=Suggestor.MODES, default="entropy")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--remove-previous-wordles", action="store_true")
+    parser.add_argument("--remove-plural", action="store_true")
+    parser.add_argument("--remove-past-tense", action="store_true")
+    parser.add_argument("--remove-un", action="store_true")
+    args = parser.parse_args()
+
+    dictionary = Session.get_dictionary(args.remove_previous_wordles, args.remove_plural,
+                                        args.remove_past_tense, args.remove_un)
+    start = time.perf_counter()
+    book = build(args.opener, dictionary, args.mode, args.depth)
+    output = args.output or default_path(args.opener, args.mode, dictionary.flags)
+    book.save(output)
+    print(f"{len(book.moves)} moves in {time.perf_counter() - start:.1f}s, saved to {output}")
@@ -0,0 +1,160 @@
+import logging
+import multiprocessing
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src import Patterns, Suggestor
+
+log = logging.getLogger()
+
+# Chunks of guesses handed to each worker per call, more than one so a slow chunk doesn't hold up the rest.
+CHUNKS_PER_PROCESS = 4
+
+
+class SharedArray:
+    """ A numpy array in a named shared memory block, other processes attach to it by its `spec`.
+
+    The process that creates the block owns it and unlinks it on `close`.
+    """
+    def __init__(self, shape, dtype, name: str = None):
+        dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def copy_of(cls, array: np.ndarray) -> "SharedArray":
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec: tuple) -> "SharedArray":
+        name, shape, dtype = spec
+        return cls(shape, dtype, name)
+
+    @property
+    def spec(self) -> tuple:
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self) -> None:
+        # the array is a view of the block, it has to go before the block can be closed
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class ParallelScorer:
+    """ Scores guesses on a pool of worker processes, each scoring a chunk of the allowed guesses.
+
+    The pattern matrix (or the letter arrays, for word lists too big for the matrix) is copied into shared
+    memory once, when the pool starts.  Each call only writes the remaining words (as a mask over the
+    answers), the allowed guesses and the tie break bonus into shared arrays, so a task is just a range of
+    guesses, and each worker sends back only the top k of its chunk.
+
+    The pool lives as long as the scorer, since starting it (and sharing the matrix) costs far more than
+    scoring.  Calls are not thread safe, they share the arrays.
+
+    ex:
+        scorer = ParallelScorer("entropy", Patterns.get_pattern_matrix(), processes=32)
+        ids, scores = scorer.top_guesses(candidate_ids, guess_ids, bonus, 20)
+
+    """
+
+    def __init__(self, mode: str, pattern_matrix: Patterns.PatternMatrix, processes: int = None):
+        """
+        Args:
+            mode: the `Suggestor` mode to score with
+            pattern_matrix: the pattern matrix to score against
+            processes: worker processes, defaults to the number of cores
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        n_guesses, n_answers = len(pattern_matrix.guesses), len(pattern_matrix.answers)
+        arrays = {}
+        try:
+            if pattern_matrix.matrix is not None:
+                arrays["matrix"] = SharedArray.copy_of(pattern_matrix.matrix)
+            else:
+                arrays["guess_letters"] = SharedArray.copy_of(pattern_matrix.guess_letters)
+                arrays["answer_letters"] = SharedArray.copy_of(pattern_matrix.answer_letters)
+            arrays["candidates"] = SharedArray((n_answers,), bool)
+            arrays["guesses"] = SharedArray((n_guesses,), np.intp)
+            arrays["bonus"] = SharedArray((n_guesses,), np.float64)
+            specs = {key: shared.spec for key, shared in arrays.items()}
+            pool = multiprocessing.get_context("fork").Pool(self.processes, _init_worker,
+                                                            (specs, mode, pattern_matrix.length))
+        except BaseException:
+            for shared in arrays.values():
+                shared.close()
+            raise
+        self.arrays = arrays
+        self.pool = pool
+        log.info(f"Started {self.processes} scoring processes for {n_guesses} x {n_answers} patterns")
+        # stop the workers and free the shared memory when the scorer goes away, or at exit
+        self._finalizer = weakref.finalize(self, _shutdown, pool, list(arrays.values()))
+
+    def top_guesses(self, candidate_ids: np.ndarray, guess_ids: np.ndarray, bonus: np.ndarray, k: int):
+        """ The k best allowed guesses against the remaining words.
+
+        Args:
+            candidate_ids: the column indexes of the remaining words in the pattern matrix
+            guess_ids: the row indexes of the allowed guesses
+            bonus: added to the score of every guess, by row index, to break ties
+            k: the number of guesses to return
+
+        Returns:
+            (guess ids, scores): the best guesses, best last
+
+        """
+        candidates = self.arrays["candidates"].array
+        candidates[:] = False
+        candidates[candidate_ids] = True
+        n_guesses = len(guess_ids)
+        self.arrays["guesses"].array[:n_guesses] = guess_ids
+        self.arrays["bonus"].array[:] = bonus
+
+        n_chunks = max(min(n_guesses, self.processes * CHUNKS_PER_PROCESS), 1)
+        bounds = np.linspace(0, n_guesses, n_chunks + 1).astype(int)
+        results = self.pool.starmap(_top_guesses_worker,
+                                    [(start, stop, k) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start])
+        ids = np.concatenate([ids for ids, _ in results])
+        scores = np.concatenate([scores for _, scores in results])
+        return Suggestor.top_k(ids, scores, k)
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+def _shutdown(pool, arrays) -> None:
+    pool.terminate()
+    pool.join()
+    for shared in arrays:
+        shared.close()
+
+
+# The shared arrays and the scorer of a worker process, set up once when the worker starts.
+_worker_arrays: dict = None
+_worker_scorer: Suggestor.Suggestor = None
+
+
+def _init_worker(specs: dict, mode: str, length: int) -> None:
+    global _worker_arrays, _worker_scorer
+    _worker_arrays = {key: SharedArray.attach(spec) for key, spec in specs.items()}
+    if "matrix" in _worker_arrays:
+        pattern_matrix = Patterns.PatternMatrix((), (), _worker_arrays["matrix"].array, length)
+    else:
+        pattern_matrix = Patterns.PatternMatrix((), (), None, length)
+        pattern_matrix.guess_letters = _worker_arrays["guess_letters"].array
+        pattern_matrix.answer_letters = _worker_arrays["answer_letters"].array
+    _worker_scorer = Suggestor.Suggestor(mode, length=length, pattern_matrix=pattern_matrix)
+
+
+def _top_guesses_worker(start: int, stop: int, k: int):
+    candidate_ids = np.flatnonzero(_worker_arrays["candidates"].array)
+    guess_ids = _worker_arrays["guesses"].array[start:stop]
+    scores = _worker_scorer.score_all_guesses(candidate_ids, guess_ids) + _worker_arrays["bonus"].array[guess_ids]
+    return Suggestor.top_k(guess_ids, scores, k)
@@ -0,0 +1,242 @@
+import logging
+from functools import cache, cached_property
+
+import numpy as np
+
+from src import Utils
+from src.WordGuess import Code
+
+log = logging.getLogger()
+
+
+# Tile values used to build a pattern code.  A pattern is the base 3 number
+# made from the tile values, with the first letter as the least significant digit,
+# so there are 3^5 = 243 possible patterns for a five letter guess, see `n_patterns` for other lengths.
+COLOR_VALUES = {Code.incorrect: 0, Code.present: 1, Code.correct: 2}
+VALUE_COLORS = {v: k for k, v in COLOR_VALUES.items()}
+
+# Number of guesses scored at once when building the matrix, this bounds the
+# size of the temporary (chunk x answers x word length) arrays, as does CHUNK_ELEMENTS for long answer lists.
+CHUNK_SIZE = 256
+CHUNK_ELEMENTS = 1 << 22
+
+# Word lists whose full matrix would be bigger than this aren't saved, their patterns are computed
+# as they're needed instead, a chunk of guesses at a time.
+MAX_MATRIX_BYTES = 1 << 30
+
+
+def n_patterns(length: int) -> int:
+    """ The number of patterns for a word length, 3^length
+    """
+    return 3 ** length
+
+
+def pattern_dtype(length: int) -> np.dtype:
+    """ The smallest unsigned int that fits every pattern code: uint8 up to five letters, uint16 past that
+    """
+    return np.dtype(np.uint8) if n_patterns(length) <= 256 else np.dtype(np.uint16)
+
+
+def colors_to_pattern(colors: str) -> int:
+    """ Convert a string of tile colors (ex: "bgybb") into a pattern code
+    """
+    return sum(COLOR_VALUES[c] * 3 ** i for i, c in enumerate(colors))
+
+
+def pattern_to_colors(pattern: int, length: int = 5) -> str:
+    """ Convert a pattern code back into a string of tile colors
+    """
+    colors = []
+    for _ in range(length):
+        colors.append(VALUE_COLORS[pattern % 3])
+        pattern //= 3
+    return "".join(colors)
+
+
+def score_guess(guess: str, answer: str) -> str:
+    """ Returns the tile colors wordle would give for a guess against an answer.
+
+    Greens are handed out first, then yellows from left to right, but only as many yellows as
+    there are unmatched copies of that letter left in the answer.
+
+    ex: guessing "sassy" against "essay" returns "yygbg"
+
+    Args:
+        guess: the guessed word
+        answer: the hidden word
+
+    Returns:
+        the tile colors of the guess
+
+    """
+    colors = [Code.incorrect] * len(guess)
+    remaining = {}
+    for i, (g, a) in enumerate(zip(guess, answer)):
+        if g == a:
+            colors[i] = Code.correct
+        else:
+            remaining[a] = remaining.get(a, 0) + 1
+
+    for i, g in enumerate(guess):
+        if colors[i] != Code.correct and remaining.get(g, 0) > 0:
+            colors[i] = Code.present
+            remaining[g] -= 1
+
+    return "".join(colors)
+
+
+def compute_patterns(guess_letters: np.ndarray, answer_letters: np.ndarray) -> np.ndarray:
+    """ Compute the pattern code of every guess against every answer.
+
+    Uses the same duplicate letter rules as `score_guess`, but vectorized over all answers at once.
+
+    Args:
+        guess_letters: (G x word length) letter array of the guesses, from `Utils.words_to_array`
+        answer_letters: (A x word length) letter array of the answers
+
+    Returns:
+        a (G x A) array of pattern codes, uint8 for words up to five letters and uint16 past that
+
+    """
+    n_guesses, length = guess_letters.shape
+    dtype = pattern_dtype(length)
+    result = np.empty((n_guesses, answer_letters.shape[0]), dtype=dtype)
+    answers = answer_letters[None, :, :]
+    chunk_size = max(1, min(CHUNK_SIZE, CHUNK_ELEMENTS // max(answer_letters.shape[0] * length, 1)))
+
+    for start in range(0, n_guesses, chunk_size):
+        guesses = guess_letters[start:start + chunk_size, None, :]
+        green = guesses == answers
+        # answer letters that are not already matched by a green are available for yellows.
+        unmatched = np.where(green, 255, answers)
+        pattern = np.zeros(green.shape[:2], dtype=dtype)
+        yellows = []
+
+        for i in range(length):
+            letter = guesses[:, :, i:i + 1]
+            available = (unmatched == letter).sum(axis=2)
+            used = np.zeros_like(available)
+            for j, prev_yellow in enumerate(yellows):
+                used += prev_yellow & (guesses[:, :, j] == guesses[:, :, i])
+            yellow = ~green[:, :, i] & (used < available)
+            yellows.append(yellow)
+            pattern += (2 * green[:, :, i] + yellow).astype(dtype) * dtype.type(3 ** i)
+
+        result[start:start + chunk_size] = pattern
+
+    return result
+
+
+class PatternMatrix:
+    """ The feedback pattern of every guess against every answer.
+
+    The matrix is saved to `data/cache` as a `.npy` file keyed by the hash of the word lists,
+    and is loaded memory mapped, so loading is near instant and the pages are shared by every process
+    using the same file.
+
+    Lookups are a single array index: `matrix.matrix[guess_id, answer_id]`, or `block` for many at once.
+
+    For word lists too big for the whole matrix (see MAX_MATRIX_BYTES), `matrix` is None and `block`
+    computes the patterns it's asked for from the letter arrays instead.
+
+    """
+
+    def __init__(self, guesses, answers, matrix: np.ndarray, length: int = None):
+        self.guesses = tuple(guesses)
+        self.answers = tuple(answers)
+        self.matrix = matrix
+        self.length = length or (len(self.guesses[0]) if self.guesses else Utils.WORD_LENGTH)
+        self.n_patterns = n_patterns(self.length)
+        self.all_correct = self.n_patterns - 1
+        self.guess_index = {w: i for i, w in enumerate(self.guesses)}
+        self.answer_index = {w: i for i, w in enumerate(self.answers)}
+
+    @cached_property
+    def guess_letters(self) -> np.ndarray:
+        return Utils.words_to_array(self.guesses, self.length)
+
+    @cached_property
+    def answer_letters(self) -> np.ndarray:
+        return Utils.words_to_array(self.answers, self.length)
+
+    @classmethod
+    def load(cls, guesses=None, answers=None, rebuild: bool = False, length: int = Utils.WORD_LENGTH,
+             max_bytes: int = MAX_MATRIX_BYTES):
+        """ Load the pattern matrix for the given word lists, building and saving it if needed.
+
+        Args:
+            guesses: the allowed guesses, defaults to every word of the word length
+            answers: the possible answers, defaults to the guesses so that
+                any filtered candidate list is a subset of the columns
+            rebuild: if True, recompute the matrix even if it is already on disk
+            length: the word length, used for the default word list
+            max_bytes: the largest matrix to build, past this the patterns are computed as they're needed
+
+        Returns:
+            the pattern matrix
+
+        """
+        guesses = tuple(Utils.get_words(length) if guesses is None else guesses)
+        answers = tuple(guesses if answers is None else answers)
+        if guesses:
+            length = len(guesses[0])
+        if len(guesses) * len(answers) * pattern_dtype(length).itemsize > max_bytes:
+            log.info(f"{len(guesses)} x {len(answers)} is too many patterns to keep, computing them as needed")
+            return cls(guesses, answers, None, length)
+
+        path = Utils.cache_dir / f"patterns-{Utils.word_list_hash(guesses, answers)}.npy"
+
+        if rebuild or not path.exists():
+            log.info(f"Building pattern matrix {len(guesses)} x {len(answers)}")
+            matrix = compute_patterns(Utils.words_to_array(guesses), Utils.words_to_array(answers))
+            with Utils.atomic_write(path, "wb") as f:
+                np.save(f, matrix)
+
+        return cls(guesses, answers, np.load(path, mmap_mode="r"), length)
+
+    def block(self, rows, columns) -> np.ndarray:
+        """ The patterns of some guesses against some answers.
+
+        Args:
+            rows: the guess indexes, as a single index, a slice or an array
+            columns: an array of answer indexes
+
+        Returns:
+            the patterns, (rows x columns), or just (columns) for a single row
+
+        """
+        if self.matrix is not None:
+            if isinstance(rows, (slice, int, np.integer)):
+                return self.matrix[rows, columns]
+            return self.matrix[np.ix_(rows, columns)]
+
+        single = isinstance(rows, (int, np.integer))
+        patterns = compute_patterns(self.guess_letters[[rows] if single else rows], self.answer_letters[columns])
+        return patterns[0] if single else patterns
+
+    def pattern(self, guess: str, answer: str) -> int:
+        """ Returns the pattern code of a guess against an answer
+        """
+        return int(self.block(self.guess_index[guess], [self.answer_index[answer]])[0])
+
+    def colors(self, guess: str, answer: str) -> str:
+        """ Returns the tile colors of a guess against an answer
+        """
+        return pattern_to_colors(self.pattern(guess, answer), self.length)
+
+    def answer_ids(self, words) -> np.ndarray:
+        """ Returns the column indexes of a list of answers
+        """
+        return np.fromiter((self.answer_index[w] for w in words), dtype=np.intp)
+
+    def guess_ids(self, words) -> np.ndarray:
+        """ Returns the row indexes of a list of guesses
+        """
+        return np.fromiter((self.guess_index[w] for w in words), dtype=np.intp)
+
+
+@cache
+def get_pattern_matrix(length: int = Utils.WORD_LENGTH) -> PatternMatrix:
+    """ The shared pattern matrix over the full word list of a word length, five letters by default
+    """
+    return PatternMatrix.load(length=length)
@@ -0,0 +1,98 @@
+import contextlib
+import json
+import logging
+import time
+from collections import defaultdict
+from pathlib import Path
+
+log = logging.getLogger()
+
+
+class Profiler:
+    """ Per phase timers and counters for the hot paths.
+
+    Phases are timed with `phase`, and anything countable (ex: words eliminated by each kind of rule) is
+    added up with `count`.  Both do nothing while the profiler is disabled, so the instrumentation can
+    stay in place.
+
+    ex:
+        with profiler.phase("filter"):
+            ...
+        profiler.count("eliminated.guess", before - after)
+
+    """
+    def __init__(self):
+        self.enabled = False
+        self.timings = defaultdict(lambda: {"calls": 0, "total": 0.0, "max": 0.0})
+        self.counters = defaultdict(int)
+
+    def reset(self) -> None:
+        self.timings.clear()
+        self.counters.clear()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """ Time the body of the with block as one call of a phase
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            timing = self.timings[name]
+            timing["calls"] += 1
+            timing["total"] += elapsed
+            timing["max"] = max(timing["max"], elapsed)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += n
+
+    def metrics(self) -> dict:
+        """ The timings (in seconds) and counters so far, as plain JSON-able dicts
+        """
+        phases = {name: {"calls": t["calls"], "total": t["total"], "mean": t["total"] / t["calls"], "max": t["max"]}
+                  for name, t in sorted(self.timings.items())}
+        return {"phases": phases, "counters": dict(sorted(self.counters.items()))}
+
+    def report(self) -> str:
+        lines = [f"{'phase':30} {'calls':>7} {'total ms':>11} {'mean ms':>10} {'max ms':>10}"]
+        for name, t in self.metrics()["phases"].items():
+            lines.append(f"{name:30} {t['calls']:7d} {t['total'] * 1000:11.3f} {t['mean'] * 1000:10.3f} "
+                         f"{t['max'] * 1000:10.3f}")
+        for name, n in self.metrics()["counters"].items():
+            lines.append(f"{name:30} {n:7d}")
+        return "\n".join(lines)
+
+    def dump(self, path: Path) -> None:
+        """ Write the metrics to a JSON file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.metrics(), f, indent=1)
+        log.info("Wrote profile metrics to %s", path)
+
+
+# The profiler everything reports to, disabled until `enable` is called.
+profiler = Profiler()
+
+
+def enable() -> Profiler:
+    profiler.enabled = True
+    return profiler
+
+
+def disable() -> None:
+    profiler.enabled = False
+
+
+def phase(name: str):
+    return profiler.phase(name)
+
+
+def count(name: str, n: int = 1) -> None:
+    profiler.count(name, n)
@@ -1,14 +1,20 @@
 import logging
 from abc import ABC, abstractmethod
+from itertools import compress
 from typing import Union
 
+import numpy as np
+
+from src import Utils, Profile
+
 log = logging.getLogger()
 
 
 class LetterRule(ABC):
     """ Base class for letter rules.
 
-    Rules return a callable function that evaluates itself on a word.
+    Rules return a callable function that evaluates itself on a word,
+    or a boolean mask that evaluates itself on a whole letter array at once.
     """
     def __init__(self, letter: str, position: Union[list, set] = None):
         self.letter = letter.lower()
@@ -16,6 +22,7 @@ class LetterRule(ABC):
         if position is None:
             position = []
         self.position = set(position)
+        self.index = ord(self.letter) - ord("a")
 
         self.__post_init__()
 
@@ -27,6 +34,23 @@ class LetterRule(ABC):
     def get_rule(self) -> callable:
         pass
 
+    @abstractmethod
+    def get_mask(self, letters: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """ Evaluate the rule on every word at once.
+
+        Args:
+            letters: (N x word length) letter array of the words, from `Utils.words_to_array`
+            counts: (N x 26) letter count array of the words, from `Utils.letter_counts`
+
+        Returns:
+            a boolean mask of the words that pass the rule
+
+        """
+        pass
+
+    def sorted_positions(self) -> list[int]:
+        return sorted(self.position)
+
     def eval(self, word) -> bool:
         return self.get_rule()(word)
 
@@ -41,13 +65,16 @@ class IsNotIn(LetterRule):
     ex: a letter is guessed once in a word and the tile color is black
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is not in word")
+        log.debug("Making rule %s is not in word", self.letter)
 
     def get_rule(self):
         def rule(word: str) -> bool:
             return self.letter not in word
         return rule
 
+    def get_mask(self, letters, counts):
+        return counts[:, self.index] == 0
+
     def __str__(self):
         return f"{self.letter} is not in word"
 
@@ -64,13 +91,16 @@ class IsIn(LetterRule):
         indicating the letter is somewhere in the word.
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is in word")
+        log.debug("Making rule %s is in word", self.letter)
 
     def get_rule(self):
         def rule(word: str) -> bool:
             return self.letter in word
         return rule
 
+    def get_mask(self, letters, counts):
+        return counts[:, self.index] > 0
+
     def __str__(self):
         return f"{self.letter} is in word"
 
@@ -88,12 +118,15 @@ class IsNotAt(LetterRule):
 
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is not at {self.position} word")
+        log.debug("Making rule %s is not at %s word", self.letter, self.position)
     def get_rule(self):
         def rule(word: str) -> bool:
             return all([word[p] != self.letter for p in self.position])
         return rule
 
+    def get_mask(self, letters, counts):
+        return (letters[:, self.sorted_positions()] != self.index).all(axis=1)
+
     def __str__(self):
         return f"{self.letter} is not at {self.position}"
 
@@ -110,7 +143,7 @@ class IsPresent(LetterRule):
 
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is present in word")
+        log.debug("Making rule %s is present in word", self.letter)
 
     def get_rule(self):
         isnotat = IsNotAt(self.letter, self.position).get_rule()
@@ -119,6 +152,11 @@ class IsPresent(LetterRule):
             return isnotat(word) and isin(word)
         return rule
 
+    def get_mask(self, letters, counts):
+        isnotat = IsNotAt(self.letter, self.position).get_mask(letters, counts)
+        isin = IsIn(self.letter, self.position).get_mask(letters, counts)
+        return isnotat & isin
+
 
 class IsAt(LetterRule):
     """ A rule indicating that a letter is present in a word at a specified location, and may be present elsewhere.
@@ -132,13 +170,16 @@ class IsAt(LetterRule):
 
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is at {self.position} in word")
+        log.debug("Making rule %s is at %s in word", self.letter, self.position)
 
     def get_rule(self):
         def rule(word: str) -> bool:
             return all([word[p] == self.letter for p in self.position])
         return rule
 
+    def get_mask(self, letters, counts):
+        return (letters[:, self.sorted_positions()] == self.index).all(axis=1)
+
     def __str__(self):
         return f"{self.letter} is at {self.position}"
 
@@ -155,7 +196,7 @@ class IsOnlyAt(LetterRule):
 
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is only at {self.position} in word")
+        log.debug("Making rule %s is only at %s in word", self.letter, self.position)
 
     def get_rule(self):
         def rule(word: str) -> bool:
@@ -164,6 +205,11 @@ class IsOnlyAt(LetterRule):
             return all([w == self.letter for w in should_be_letters]) and all([w != self.letter for w in should_not_be_letters])
         return rule
 
+    def get_mask(self, letters, counts):
+        # Being at every position, and appearing exactly that many times means it appears nowhere else.
+        is_at = IsAt(self.letter, self.position).get_mask(letters, counts)
+        return is_at & (counts[:, self.index] == len(self.position))
+
     def __str__(self):
         return f"{self.letter} is only at {self.position}"
 
@@ -178,13 +224,16 @@ class IsOnlyNOf(LetterRule):
         is only one s in the word.
     """
     def __post_init__(self):
-        log.debug(f"Making rule {self.letter} is only {len(self.position)} of in word")
+        log.debug("Making rule %s is only %d of in word", self.letter, len(self.position))
 
     def get_rule(self):
         def rule(word: str) -> bool:
             return len([i for i in word if i == self.letter]) == len(self.position)
         return rule
 
+    def get_mask(self, letters, counts):
+        return counts[:, self.index] == len(self.position)
+
 
 def evaluate_rules_in_list(word_list: list[str], rules: list[LetterRule]) -> list[str]:
     """ Applies each rule to a list of words and filters out words that do not pass the rule's evaluation
@@ -197,13 +246,35 @@ def evaluate_rules_in_list(word_list: list[str], rules: list[LetterRule]) -> lis
         a new, filtered word list of only words that pass the rules.
 
     """
-    print("here")
-    print(rules)
-    for rule in rules:
-        rule = rule.get_rule()
-        log.debug(f'creating new word list for rule {rule}')
-        word_list = [word for word in word_list if rule(word)]
-        log.debug("done")
-
-    return word_list
+    log.debug("filtering %d words with rules %s", len(word_list), rules)
+    letters = Utils.words_to_array(word_list)
+    mask = evaluate_rules_in_array(letters, Utils.letter_counts(letters), rules)
+    return list(compress(word_list, mask))
+
+
+def evaluate_rules_in_array(letters: np.ndarray, counts: np.ndarray, rules: list[LetterRule]) -> np.ndarray:
+    """ Applies every rule to a letter array at once and returns the mask of words that pass them all
+
+    Args:
+        letters: (N x word length) letter array of the words, from `Utils.words_to_array`
+        counts: (N x 26) letter count array of the words, from `Utils.letter_counts`
+        rules: the rules to test on the words
+
+    Returns:
+        a boolean mask of the words that pass every rule
+
+    """
+    profiler = Profile.profiler
+    mask = np.ones(letters.shape[0], dtype=bool)
+    with profiler.phase("filter.rules"):
+        for rule in rules:
+            log.debug("applying mask for rule %s", rule)
+            if profiler.enabled:
+                before = int(np.count_nonzero(mask))
+                mask &= rule.get_mask(letters, counts)
+                profiler.count(f"eliminated.{type(rule).__name__}", before - int(np.count_nonzero(mask)))
+            else:
+                mask &= rule.get_mask(letters, counts)
+
+    return mask
 
@@ -0,0 +1,405 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import cache, cached_property
+from typing import TYPE_CHECKING
+
+from src import Utils, Index, Suggestor, Stats, Profile, SuggestionCache
+from src.Constraints import ConstraintState
+from src.Utils import ALPHABET
+from src.WordGuess import Code
+
+if TYPE_CHECKING:
+    from src.OpeningBook import OpeningBook
+
+log = logging.getLogger()
+
+
+@dataclass(frozen=True)
+class Dictionary:
+    """ The word data every session reads from, built once and never modified.
+
+    Sessions only keep a bitset of their remaining words into it, so any number of sessions can share one.
+    """
+    index: Index.WordIndex
+    start_candidates: int
+    flags: tuple
+
+    @property
+    def words(self) -> tuple[str, ...]:
+        return self.index.words
+
+    @property
+    def length(self) -> int:
+        return self.index.length
+
+    @cached_property
+    def key(self) -> str:
+        """ Identifies the word list in cache keys: the word length, the filters and the hash of the words
+        """
+        flags = "".join("1" if f else "0" for f in self.flags)
+        return f"{self.length}:{flags}:{Utils.word_list_hash(self.index.decode(self.start_candidates))}"
+
+
+@cache
+def get_dictionary(remove_previous_wordles=False, remove_plural=False, remove_past_tense=False, remove_un=False,
+                   length: int = Utils.WORD_LENGTH) -> Dictionary:
+    """ The shared dictionary for a combination of word list filters and a word length
+    """
+    flags = (remove_previous_wordles, remove_plural, remove_past_tense, remove_un)
+    return Dictionary(Index.get_index(length), Index.get_word_list_bits(*flags, length=length), flags)
+
+
+@cache
+def get_suggestor(mode: str = "heuristic", length: int = Utils.WORD_LENGTH, processes: int = 1) -> Suggestor.Suggestor:
+    """ The shared suggestor for a scoring mode, a word length and a number of scoring processes
+    """
+    return Suggestor.Suggestor(mode, length=length, processes=processes)
+
+
+@dataclass
+class GuessResult:
+    remaining: tuple[str, ...]
+    suggestions: tuple[str, ...] = ()
+    scores: tuple[float, ...] = ()
+
+    @property
+    def n_remaining(self) -> int:
+        return len(self.remaining)
+
+    @property
+    def won(self) -> bool:
+        return len(self.remaining) == 1
+
+
+@dataclass
+class Session:
+    """ One game, driven by passing in guesses and their colors rather than prompting for them.
+
+    The per session state is only the constraints so far, a bitset of the remaining words and the
+    letters not guessed yet, everything else is shared.
+
+    With an opening book, suggestions come straight from the book for as long as the guesses follow it.
+
+    In hard mode every guess has to be consistent with the hints so far, both the guesses passed in
+    and the suggestions.
+
+    With a cache (ex: `SuggestionCache.shared_cache`), suggestions are looked up by `cache_key` first, so every
+    session reaching the same state shares them.  The cache assumes the remaining words come from the guesses,
+    rather than from `candidates` passed in.
+
+    ex:
+        session = Session()
+        result = session.guess("crane", "bgybb")
+        print(result.n_remaining, result.suggestions[-1])
+
+    """
+    dictionary: Dictionary = field(default_factory=get_dictionary)
+    suggestor: Suggestor.Suggestor = field(default_factory=get_suggestor)
+    state: ConstraintState = None
+    candidates: int = None
+    unknown_letters: list = field(default_factory=lambda: list(ALPHABET))
+    history: list = field(default_factory=list)
+    letter_tracker: Stats.LetterCountTracker = None
+    book: "OpeningBook" = None
+    hard_mode: bool = False
+    cache: SuggestionCache.SuggestionCache = None
+
+    def __post_init__(self):
+        if self.suggestor.length != self.dictionary.length:
+            raise ValueError(f"A suggestor for {self.suggestor.length} letter words can't play "
+                             f"{self.dictionary.length} letter words")
+        if self.state is None:
+            self.state = ConstraintState.empty(self.dictionary.length)
+        if self.candidates is None:
+            self.candidates = self.dictionary.start_candidates
+
+    @property
+    def n_remaining(self) -> int:
+        return Index.count(self.candidates)
+
+    def remaining(self) -> tuple[str, ...]:
+        return tuple(self.dictionary.index.decode(self.candidates))
+
+    def is_won(self) -> bool:
+        return self.n_remaining == 1
+
+    def legal_guesses(self) -> tuple[str, ...]:
+        """ The words allowed as the next guess in hard mode: every word in the dictionary, including the ones
+        filtered out as answers, that is consistent with the constraints so far
+        """
+        with Profile.phase("filter.legal"):
+            return tuple(self.dictionary.index.decode(self.dictionary.index.apply(self.state)))
+
+    def guess(self, letters: str, colors: str, suggest: bool = True) -> GuessResult:
+        """ Apply a guess and its tile colors.
+
+        Args:
+            letters: the guessed word
+            colors: the tile colors, ex: "bgybb"
+            suggest: if True, also return suggestions for the next guess
+
+        Returns:
+            the remaining words, and the suggestions if asked for
+
+        Raises:
+            ValueError: if the guess or colors aren't valid, or in hard mode, if the guess doesn't use the hints so far
+            ContradictionError: if the guess contradicts an earlier guess, the session is left unchanged
+
+        """
+        letters = letters.lower()
+        self.state = self.check_guess(letters, colors)
+        with Profile.phase("filter"):
+            before = self.candidates
+            self.candidates = self.dictionary.index.apply(self.state, self.candidates)
+        if Profile.profiler.enabled:
+            Profile.count("eliminated.guess", Index.count(before) - self.n_remaining)
+        self.unknown_letters = [l for l in self.unknown_letters if l not in letters]
+        self.history.append((letters, colors))
+
+        remaining = self.remaining()
+        if not suggest or len(remaining) <= 1:
+            return GuessResult(remaining)
+        words, scores = self.suggest(remaining)
+        return GuessResult(remaining, tuple(words), tuple(scores))
+
+    def check_guess(self, letters: str, colors: str) -> ConstraintState:
+        """ Check a guess and its tile colors without changing the session.
+
+        Returns:
+            the state with the guess included
+
+        Raises:
+            (see `guess`)
+
+        """
+        letters = letters.lower()
+        if any(c not in Code.keys() for c in colors):
+            raise ValueError(f"Invalid colors {colors}, expected only {Code.keys()}")
+        if any(l not in ALPHABET for l in letters) or len(letters) != self.dictionary.length:
+            raise ValueError(f"Invalid guess {letters}, expected {self.dictionary.length} letters")
+        if self.hard_mode and not self.state.matches(letters):
+            raise ValueError(f"{letters} doesn't use every hint so far, which hard mode requires")
+
+        with Profile.phase("rules"):
+            return self.state.add_guess(letters, colors)
+
+    def suggest(self, remaining=None, budget: float = None) -> tuple[tuple, tuple]:
+        """ Suggestions for the next guess, best last
+
+        Args:
+            remaining: the remaining words, if they're already known
+            budget: the most seconds to spend, see `Suggestor.suggest`
+        """
+        move = self.book_move()
+        if move is not None:
+            return (move,), (1.0,)
+        cached = self.cached_suggestions()
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        suggestions = self.suggestor.suggest(**self.suggest_arguments(remaining), budget=budget)
+        # suggestions cut short by the budget aren't final, and only final ones are cached
+        if budget is None or time.perf_counter() - start < budget:
+            self.cache_suggestions(suggestions)
+        return suggestions
+
+    def iter_suggestions(self, budget: float = None):
+        """ Yields better and better suggestions for the next guess, see `Suggestor.iter_suggestions`
+        """
+        move = self.book_move()
+        if move is not None:
+            yield (move,), (1.0,)
+            return
+        cached = self.cached_suggestions()
+        if cached is not None:
+            yield cached
+            return
+
+        start = time.perf_counter()
+        suggestions = None
+        # timed as a whole, like the budget, so it includes the caller's redraws between suggestions
+        with Profile.phase(f"suggest.{self.suggestor.mode}"):
+            for suggestions in self.suggestor.iter_suggestions(**self.suggest_arguments(), budget=budget):
+                yield suggestions
+        if budget is None or time.perf_counter() - start < budget:
+            self.cache_suggestions(suggestions)
+
+    def cache_key(self) -> str:
+        """ Everything the suggestions depend on: the word list, what the guesses so far have told us (as the
+        canonical state, so equivalent guesses in any order share a key), how guesses are ranked, and in hard
+        mode, which guesses are allowed.  The remaining words follow from the word list and the state.
+        """
+        suggestor = self.suggestor
+        parts = [self.dictionary.key, self.state.key(), suggestor.mode, str(suggestor.num_to_return),
+                 "hard" if self.hard_mode and self.history else ""]
+        if suggestor.mode == "heuristic":
+            parts.append("".join(sorted(self.unknown_letters)))
+        return "|".join(parts)
+
+    def cached_suggestions(self) -> tuple[tuple, tuple]:
+        """ The suggestions for this state from the cache, or None
+        """
+        if self.cache is None:
+            return None
+        value = self.cache.get(self.cache_key())
+        if value is None:
+            return None
+        words, scores = value
+        return tuple(words), tuple(scores)
+
+    def cache_suggestions(self, suggestions: tuple[tuple, tuple]) -> None:
+        if self.cache is not None:
+            self.cache.put(self.cache_key(), suggestions)
+
+    def book_move(self) -> str:
+        """ The opening book's next guess, or None once the game has left the book
+        """
+        if self.book is None:
+            return None
+        move = self.book.lookup(self.history)
+        if move is not None and (not self.hard_mode or self.state.matches(move)):
+            return move
+        return None
+
+    def suggest_arguments(self, remaining=None) -> dict:
+        """ The arguments to `Suggestor.suggest` for the game so far
+        """
+        if remaining is None:
+            remaining = self.remaining()
+        arguments = {"current_possible_words": list(remaining), "unknown_letters": self.unknown_letters}
+        if self.suggestor.mode != "heuristic":
+            # nothing is ruled out before the first guess, so skip the filtering there
+            arguments["guesses"] = self.legal_guesses() if self.hard_mode and self.history else None
+            return arguments
+
+        # Only the heuristic uses letter stats, keep them up to date with the words removed since last time.
+        with Profile.phase("stats"):
+            if self.letter_tracker is None:
+                self.letter_tracker = Stats.LetterCountTracker(self.dictionary.index)
+            self.letter_tracker.update(self.candidates)
+            arguments["letter_stats"] = self.letter_tracker.in_word_stats()
+        return arguments
+
+    def reset(self) -> None:
+        """ Start a new game with the same dictionary
+        """
+        self.state = ConstraintState.empty(self.dictionary.length)
+        self.candidates = self.dictionary.start_candidates
+        self.unknown_letters = list(ALPHABET)
+        self.history = []
+
+
+@dataclass
+class MultiGuessResult:
+    remaining: tuple[tuple[str, ...], ...]
+    solved: tuple[bool, ...]
+    suggestions: tuple[str, ...] = ()
+    scores: tuple[float, ...] = ()
+
+    @property
+    def won(self) -> bool:
+        return all(self.solved)
+
+
+@dataclass
+class MultiSession:
+    """ Several boards played with the same guesses (Quordle, Octordle, ...), each board is its own `Session`.
+
+    A board is solved once a guess comes back all green, solved boards take no more colors and are left out
+    of the suggestions, which score each guess against every unsolved board at once.
+
+    ex:
+        session = MultiSession(4)
+        result = session.guess("crane", ["bgybb", "bbbbb", "ygbbb", "bbbyb"])
+        print(result.suggestions[-1])
+
+    """
+    n_boards: int = 4
+    dictionary: Dictionary = field(default_factory=get_dictionary)
+    suggestor: Suggestor.Suggestor = None
+    boards: list = None
+    solved: list = None
+
+    def __post_init__(self):
+        if self.suggestor is None:
+            self.suggestor = get_suggestor("entropy", self.dictionary.length)
+        if self.boards is None:
+            self.boards = [Session(self.dictionary, self.suggestor) for _ in range(self.n_boards)]
+        if self.solved is None:
+            self.solved = [False] * self.n_boards
+
+    def unsolved(self) -> list[int]:
+        return [i for i, solved in enumerate(self.solved) if not solved]
+
+    def remaining(self) -> tuple[tuple[str, ...], ...]:
+        return tuple(board.remaining() for board in self.boards)
+
+    def is_won(self) -> bool:
+        return all(self.solved)
+
+    def guess(self, letters: str, colors: list, suggest: bool = True) -> MultiGuessResult:
+        """ Apply a guess and the tile colors it got on every board.
+
+        Args:
+            letters: the guessed word
+            colors: the tile colors for each board, entries for solved boards are ignored (and can be None)
+            suggest: if True, also return suggestions for the next guess
+
+        Returns:
+            the remaining words of each board, and the suggestions if asked for
+
+        Raises:
+            ValueError: if the guess or colors aren't valid for any board, no board is changed
+            ContradictionError: if the guess contradicts an earlier guess on any board, no board is changed
+
+        """
+        if len(colors) != self.n_boards:
+            raise ValueError(f"Expected colors for {self.n_boards} boards, got {len(colors)}")
+        active = self.unsolved()
+        # check every board before changing any of them, so a bad guess or color string leaves them all as they were
+        for i in active:
+            if colors[i] is None:
+                raise ValueError(f"Missing the colors for board {i + 1}, which isn't solved yet")
+            self.boards[i].check_guess(letters, colors[i])
+
+        for i in active:
+            self.boards[i].guess(letters, colors[i], suggest=False)
+            if all(c == Code.correct for c in colors[i]):
+                self.solved[i] = True
+
+        remaining = self.remaining()
+        if not suggest or self.is_won():
+            return MultiGuessResult(remaining, tuple(self.solved))
+        words, scores = self.suggest()
+        return MultiGuessResult(remaining, tuple(self.solved), tuple(words), tuple(scores))
+
+    def suggest(self) -> tuple[tuple, tuple]:
+        """ Suggestions for the next guess over the unsolved boards, best last
+
+        A board down to one word is always worth solving right away, so those words are suggested first.
+        A board with no words left (ex: its answer was filtered out of the word list) is left out, and
+        with no other boards there's nothing to suggest.
+        """
+        boards = []
+        for i in self.unsolved():
+            words = self.boards[i].remaining()
+            if not words:
+                log.warning(f"No words left on board {i + 1}, leaving it out of the suggestions")
+                continue
+            boards.append(words)
+        if not boards:
+            return (), ()
+        singles = tuple(words[0] for words in boards if len(words) == 1)
+        if singles:
+            return singles, (1.0,) * len(singles)
+        with Profile.phase("suggest.boards"):
+            return self.suggestor.find_multi_board_guesses([list(words) for words in boards])
+
+    def reset(self) -> None:
+        """ Start new games on every board
+        """
+        for board in self.boards:
+            board.reset()
+        self.solved = [False] * self.n_boards
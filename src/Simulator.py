@@ -0,0 +1,249 @@
+import argparse
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from src import Utils, Stats, Suggestor, Patterns, Index
+from src.Constraints import ConstraintState
+from src.Utils import ALPHABET
+
+log = logging.getLogger()
+
+STRATEGIES = ("heuristic", "entropy", "expected_size", "lookahead", "wordstats")
+
+
+def make_strategy(name: str) -> callable:
+    """ Build a strategy function by name.
+
+    A strategy takes the remaining words, the letters that haven't been guessed yet and the full word list,
+    and returns the next guess.
+
+    Args:
+        name: one of STRATEGIES. "wordstats" is `Stats.WordStats.find_best_guess`, the rest are `Suggestor` modes
+
+    Returns:
+        the strategy function
+
+    """
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {name}, expected one of {STRATEGIES}")
+
+    if name == "wordstats":
+        word_stats = Stats.WordStats(None, None)
+
+        def strategy(current_possible_words, unknown_letters, full_word_list):
+            # The rating only looks at shared letters, so it never prefers guessing one of the last two words.
+            if len(current_possible_words) <= 2:
+                return current_possible_words[0]
+            words, _ = word_stats.find_best_guess(full_word_list, current_possible_words, quiet=True)
+            return words[-1]
+        return strategy
+
+    suggestor = Suggestor.Suggestor(name)
+
+    def strategy(current_possible_words, unknown_letters, full_word_list):
+        words, _ = suggestor.suggest(current_possible_words, unknown_letters)
+        return words[-1]
+    return strategy
+
+
+@dataclass
+class GameResult:
+    answer: str
+    n_guesses: int  # 0 if the game was lost
+    guesses: list = field(default_factory=list)
+    latencies: list = field(default_factory=list)  # seconds spent picking each guess after the opener
+
+    @property
+    def won(self) -> bool:
+        return self.n_guesses > 0
+
+
+@dataclass
+class SimulationReport:
+    strategy: str
+    results: list
+    opener: str
+    opener_latency: float
+    wall_time: float
+
+    @property
+    def n_games(self) -> int:
+        return len(self.results)
+
+    def distribution(self) -> dict:
+        """ Number of games won in each number of guesses, lost games are under 0
+        """
+        return dict(sorted(Counter(r.n_guesses for r in self.results).items()))
+
+    def failures(self) -> list[str]:
+        return [r.answer for r in self.results if not r.won]
+
+    def failure_rate(self) -> float:
+        return len(self.failures()) / max(self.n_games, 1)
+
+    def mean_guesses(self) -> float:
+        won = [r.n_guesses for r in self.results if r.won]
+        return sum(won) / max(len(won), 1)
+
+    def latency_percentiles(self, percentiles=(50, 90, 99, 100)) -> dict:
+        """ Per turn latency percentiles in milliseconds, not including the opener
+        """
+        latencies = [l for r in self.results for l in r.latencies]
+        if not latencies:
+            return {p: 0.0 for p in percentiles}
+        values = np.percentile(np.array(latencies) * 1000, percentiles)
+        return {p: float(v) for p, v in zip(percentiles, values)}
+
+    def __str__(self):
+        lines = [f"strategy: {self.strategy}  opener: {self.opener} ({self.opener_latency * 1000:.1f} ms)",
+                 f"games: {self.n_games} in {self.wall_time:.2f}s",
+                 f"mean guesses (won games): {self.mean_guesses():.3f}",
+                 f"failure rate: {self.failure_rate():.2%}"]
+        for n_guesses, n_games in self.distribution().items():
+            label = "lost" if n_guesses == 0 else f"{n_guesses} guesses"
+            lines.append(f"  {label:>10}: {n_games}")
+        latency = "  ".join(f"p{p}: {v:.1f}" for p, v in self.latency_percentiles().items())
+        lines.append(f"per turn latency (ms): {latency}")
+        return "\n".join(lines)
+
+
+class Simulator:
+    """ Plays games without any user input, to evaluate a guessing strategy.
+
+    The word index and pattern matrix are built once in the parent process, and worker processes
+    are forked from it so they share them (and the strategy) read only, without pickling anything per game.
+    """
+
+    def __init__(self, strategy: str = "entropy", max_guesses: int = 6, opener: str = None, **word_list_flags):
+        """
+        Args:
+            strategy: the strategy to evaluate, one of STRATEGIES
+            max_guesses: the number of guesses allowed before a game is lost
+            opener: the first guess, if None the strategy picks it (once, since it's the same every game)
+            word_list_flags: the filters passed to `Utils.get_word_list`
+        """
+        self.strategy_name = strategy
+        self.max_guesses = max_guesses
+        self.word_list_flags = word_list_flags
+        self.index = Index.get_index()
+        self.full_word_list = list(self.index.words)
+        self.start_candidates = Index.get_word_list_bits(**word_list_flags)
+        self.strategy = make_strategy(strategy)
+        self.opener = opener
+        self.opener_latency = 0.0
+
+    def pick_opener(self) -> str:
+        if self.opener is None:
+            start = time.perf_counter()
+            self.opener = self.strategy(self.index.decode(self.start_candidates),
+                                        list(ALPHABET), self.full_word_list)
+            self.opener_latency = time.perf_counter() - start
+        return self.opener
+
+    def play(self, answer: str) -> GameResult:
+        """ Play one game against a known answer
+        """
+        result = GameResult(answer, 0)
+        candidates = self.start_candidates
+        state = ConstraintState()
+        unknown_letters = list(ALPHABET)
+
+        for turn in range(1, self.max_guesses + 1):
+            if turn == 1:
+                guess = self.pick_opener()
+            else:
+                start = time.perf_counter()
+                guess = self.strategy(self.index.decode(candidates), unknown_letters, self.full_word_list)
+                result.latencies.append(time.perf_counter() - start)
+
+            result.guesses.append(guess)
+            if guess == answer:
+                result.n_guesses = turn
+                break
+
+            state = state.add_guess(guess, Patterns.score_guess(guess, answer))
+            candidates = self.index.apply(state, candidates)
+            unknown_letters = [l for l in unknown_letters if l not in guess]
+            if candidates == 0:
+                # The answer isn't in the word list, there's nothing left to guess.
+                break
+
+        return result
+
+    def run(self, answers, processes: int = None, chunksize: int = None) -> SimulationReport:
+        """ Play every answer, spread across a process pool
+
+        Args:
+            answers: the answers to play
+            processes: number of worker processes, defaults to the number of cores. 1 plays in this process.
+            chunksize: number of games sent to a worker at once, defaults to splitting the answers
+                into about 4 chunks per worker
+
+        Returns:
+            the report of every game
+
+        """
+        answers = list(dict.fromkeys(answers))
+        processes = processes or multiprocessing.cpu_count()
+        start = time.perf_counter()
+        self.pick_opener()
+
+        if processes == 1:
+            results = [self.play(answer) for answer in answers]
+        else:
+            chunksize = chunksize or max(1, len(answers) // (processes * 4))
+            # Warm the shared pattern matrix so forked workers inherit it rather than each loading it.
+            if self.strategy_name != "wordstats":
+                Patterns.get_pattern_matrix()
+            global _worker_simulator
+            _worker_simulator = self
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                results = list(pool.imap_unordered(_play_worker, answers, chunksize=chunksize))
+
+        return SimulationReport(self.strategy_name, results, self.opener, self.opener_latency,
+                                time.perf_counter() - start)
+
+
+# The simulator that forked workers play with, set by the parent right before the pool is created.
+_worker_simulator: Simulator = None
+
+
+def _play_worker(answer: str) -> GameResult:
+    return _worker_simulator.play(answer)
+
+
+def read_answers(path: Path = None) -> list[str]:
+    """ Read an answer list, defaults to the previous wordle answers
+    """
+    if path is None:
+        return list(Utils.get_wordles())
+    with open(path, 'r') as f:
+        return f.read().lower().split()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play every answer in a list with a guessing strategy")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="entropy")
+    parser.add_argument("--answers", type=Path, default=None, help="answer list, one word per line, defaults to the past answers in data/solutions.db")
+    parser.add_argument("--limit", type=int, default=None, help="only play the first N answers")
+    parser.add_argument("--opener", default=None, help="fixed first guess")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--max-guesses", type=int, default=6)
+    parser.add_argument("--remove-previous-wordles", action="store_true")
+    parser.add_argument("--remove-plural", action="store_true")
+    parser.add_argument("--remove-past-tense", action="store_true")
+    parser.add_argument("--remove-un", action="store_true")
+    args = parser.parse_args()
+
+    simulator = Simulator(args.strategy, max_guesses=args.max_guesses, opener=args.opener,
+                          remove_previous_wordles=args.remove_previous_wordles, remove_plural=args.remove_plural,
+                          remove_past_tense=args.remove_past_tense, remove_un=args.remove_un)
+    answers = read_answers(args.answers)[:args.limit]
+    print(simulator.run(answers, processes=args.processes, chunksize=args.chunksize))
@@ -0,0 +1,245 @@
+import logging
+import math
+import multiprocessing
+import multiprocessing.pool
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from src import Utils, Patterns, Suggestor
+
+log = logging.getLogger()
+
+# With no lookahead left, the expected number of guesses to solve n words is estimated as if every
+# guess splits the words ESTIMATED_BRANCHING ways.  4 makes 2 words take 1.5 guesses, which is exact.
+ESTIMATED_BRANCHING = 4
+
+
+class SearchTimeout(Exception):
+    """ Raised inside a search that runs past its deadline, see `Solver.rank`
+    """
+
+
+def estimate_guesses(n_words: int) -> float:
+    """ Rough estimate of the expected number of guesses to solve from n words, used past the search depth
+    """
+    if n_words <= 1:
+        return float(n_words)
+    return 1 + math.log(n_words, ESTIMATED_BRANCHING)
+
+
+class Solver:
+    """ Ranks guesses by the expected number of guesses left to solve, searching a few guesses ahead.
+
+    For a guess, the remaining words are split by the feedback they would give, and each part is solved
+    recursively (with the best guess for that part) down to `depth` guesses, after which the number of
+    guesses left is estimated from the size of the part.
+
+    To keep this tractable:
+        - only the `breadth` most informative guesses (by entropy) are searched at each step
+        - guesses that split the words exactly the same way as an earlier guess are skipped, as are
+          guesses that don't split the words at all
+        - results for a set of words are memoized in a bounded LRU cache, since many different
+          guesses lead to the same set of words
+        - the guesses at the top level are spread over a process pool, which lives as long as the solver.
+          Each worker keeps its own memo from call to call, the memo of this process only fills when
+          searching serially (processes=1).
+
+    Guesses whose split is only coarser than another guess's (dominated, rather than identical) are not
+    pruned: among the most informative guesses that is rare, and checking every pair cost more than the
+    searches it saved.  So the search is still slow from the opening position, ranking the full five letter
+    list with the defaults takes about 22 seconds on one process, and a few seconds once a guess is made.
+
+    """
+
+    def __init__(self, depth: int = 2, breadth: int = 20, cache_size: int = 100_000, processes: int = None,
+                 length: int = Utils.WORD_LENGTH):
+        """
+        Args:
+            depth: the number of guesses to search ahead, including this one
+            breadth: the number of guesses searched at each step
+            cache_size: the most sets of words to remember results for
+            processes: worker processes for the top level guesses, defaults to the number of cores, 1 searches
+                in this process
+            length: the word length
+        """
+        self.depth = depth
+        self.breadth = breadth
+        self.cache_size = cache_size
+        self.processes = processes or multiprocessing.cpu_count()
+        self.ranker = Suggestor.Suggestor("entropy", length=length)
+        self.memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.deadline = None
+        self.pool = None
+
+    @property
+    def patterns(self) -> Patterns.PatternMatrix:
+        return self.ranker.patterns
+
+    def candidate_guesses(self, answer_ids: np.ndarray, guess_ids: np.ndarray = None) -> list[int]:
+        """ The guesses worth searching for a set of words: the most informative ones, without
+        guesses that split the words the same way as another, and without guesses that don't split them.
+
+        Args:
+            answer_ids: the sorted answer indexes of the remaining words
+            guess_ids: the guess indexes allowed, defaults to every guess
+
+        Returns:
+            the guess indexes to search, most promising first
+
+        """
+        patterns = self.patterns
+        n_words = len(answer_ids)
+        scores = self.ranker.score_all_guesses(answer_ids, guess_ids)
+        if guess_ids is not None:
+            allowed_scores = scores
+            scores = np.full(len(patterns.guesses), -np.inf)
+            scores[guess_ids] = allowed_scores
+
+        # Break ties in favor of the remaining words themselves, since they might win outright.
+        own_ids = [patterns.guess_index[patterns.answers[i]] for i in answer_ids
+                   if patterns.answers[i] in patterns.guess_index]
+        scores[own_ids] += 1e-6
+        # Look at a few extra, some will be skipped below.
+        n_top = min(2 * self.breadth, len(scores))
+        top = np.argpartition(-scores, n_top - 1)[:n_top]
+        ordered = top[np.argsort(-scores[top], kind="stable")]
+
+        guesses = []
+        seen_partitions = set()
+        for guess_id in ordered:
+            if scores[guess_id] == -np.inf:
+                break
+            codes = patterns.block(guess_id, answer_ids)
+            key = codes.tobytes()
+            if key in seen_partitions:
+                continue
+            seen_partitions.add(key)
+            if len(np.unique(codes)) == 1 and codes[0] != patterns.all_correct:
+                continue
+            guesses.append(guess_id)
+            if len(guesses) >= self.breadth:
+                break
+        return guesses
+
+    def partition(self, guess_id: int, answer_ids: np.ndarray):
+        """ Yields (pattern, answer ids) for each feedback pattern the guess can get from the words
+        """
+        codes = np.asarray(self.patterns.block(guess_id, answer_ids))
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+        for part in np.split(order, boundaries):
+            yield int(codes[part[0]]), answer_ids[part]
+
+    def guess_cost(self, guess_id: int, answer_ids: np.ndarray, depth: int) -> float:
+        """ Expected number of guesses to solve the words, if this guess is made next
+        """
+        n_words = len(answer_ids)
+        cost = 1.0
+        for pattern, part in self.partition(guess_id, answer_ids):
+            if pattern == self.patterns.all_correct:
+                continue
+            cost += len(part) / n_words * self.expected_guesses(part, depth - 1)
+        return cost
+
+    def expected_guesses(self, answer_ids: np.ndarray, depth: int) -> float:
+        """ Expected number of guesses to solve the words, playing the best searched guess each time
+        """
+        n_words = len(answer_ids)
+        if n_words <= 2:
+            return [0.0, 1.0, 1.5][n_words]
+        if depth <= 0:
+            return estimate_guesses(n_words)
+
+        key = (answer_ids.tobytes(), depth)
+        if key in self.memo:
+            self.hits += 1
+            self.memo.move_to_end(key)
+            return self.memo[key]
+        self.misses += 1
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout
+
+        best = min(self.guess_cost(g, answer_ids, depth) for g in self.candidate_guesses(answer_ids))
+
+        self.memo[key] = best
+        if len(self.memo) > self.cache_size:
+            self.memo.popitem(last=False)
+        return best
+
+    def timed_guess_cost(self, guess_id: int, answer_ids: np.ndarray, depth: int) -> float:
+        """ `guess_cost`, or None if the search ran past the deadline
+        """
+        try:
+            return self.guess_cost(guess_id, answer_ids, depth)
+        except SearchTimeout:
+            return None
+
+    def rank(self, current_possible_words, guesses=None, deadline: float = None) -> tuple[tuple, tuple]:
+        """ Rank the most promising guesses by the expected number of guesses to solve.
+
+        Args:
+            current_possible_words: the words that are still possible
+            guesses: the words allowed as the next guess, defaults to every word.  Only the next guess
+                is limited, the guesses after it are searched from every word.
+            deadline: the `time.perf_counter` time to stop by, None for no limit.  Guesses whose search
+                isn't finished by then are left out, so the ranking can be partial, or empty.
+
+        Returns:
+            (words, expected guesses): the searched guesses, best last
+
+        """
+        answer_ids = np.sort(self.patterns.answer_ids(current_possible_words))
+        guess_ids = None if guesses is None else self.patterns.guess_ids(guesses)
+        guesses = self.candidate_guesses(answer_ids, guess_ids)
+
+        # pool workers are daemons and can't start pools of their own, so search serially inside one.
+        if self.processes > 1 and len(guesses) > 1 and not multiprocessing.current_process().daemon:
+            costs = self.get_pool().starmap(_guess_cost_worker,
+                                            [(g, answer_ids, self.depth, deadline) for g in guesses])
+        else:
+            self.deadline = deadline
+            try:
+                costs = [self.timed_guess_cost(g, answer_ids, self.depth) for g in guesses]
+            finally:
+                self.deadline = None
+
+        ranked = sorted(((c, g) for c, g in zip(costs, guesses) if c is not None), key=lambda c: -c[0])
+        return (tuple(self.patterns.guesses[g] for _, g in ranked),
+                tuple(float(c) for c, _ in ranked))
+
+    def get_pool(self) -> multiprocessing.pool.Pool:
+        """ The worker pool, started on first use.  The workers are forked from this solver, so each starts
+        with its pattern matrix and memo, and keeps adding to its own memo from call to call.
+        """
+        if self.pool is None:
+            global _worker_solver
+            _worker_solver = self
+            self.pool = multiprocessing.get_context("fork").Pool(self.processes)
+            # stop the workers when the solver goes away, or at exit
+            self._finalizer = weakref.finalize(self, _shutdown, self.pool)
+        return self.pool
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self._finalizer()
+            self.pool = None
+
+
+def _shutdown(pool) -> None:
+    pool.terminate()
+    pool.join()
+
+
+# The solver that forked workers search with, set by the parent right before the pool is created.
+_worker_solver: Solver = None
+
+
+def _guess_cost_worker(guess_id: int, answer_ids: np.ndarray, depth: int, deadline: float) -> float:
+    _worker_solver.deadline = deadline
+    return _worker_solver.timed_guess_cost(guess_id, answer_ids, depth)
@@ -1,11 +1,27 @@
 
 import functools
+import heapq
+from collections import Counter
 from itertools import chain, combinations
 import logging
 import re
+import time
+
+import numpy as np
+
+from src import Utils
+from src.Utils import ALPHABET
 
 log = logging.getLogger()
 
+# Bits per letter in a packed letter count signature, enough for a letter to appear up to 15 times.
+SIGNATURE_BITS = 4
+
+# Words rated between looks at the clock when `WordStats` ratings have a time budget.
+RATE_CHUNK_SIZE = 256
+# Possible words counted between looks at the clock, while setting up the ratings.
+SIGNATURE_CHUNK_SIZE = 256
+
 
 class LetterStats:
     """ Calculates frequency statistics for every letter given a list of words.
@@ -23,58 +39,76 @@ class LetterStats:
 
         self.letter_prob = None
         self.bigram_prob = None
+        # (word length x 26) array, [p, l] is the fraction of words with letter l at position p
+        self.positional_prob = None
+        # (26 x 26) array, [a, b] is the average number of times the bigram "ab" appears in a word
+        self.bigram_table = None
         self.letter_occurance = None
         self.num_words = 0
 
 
     def calc_stats(self, words = []):
+        """ Calculate the letter, positional and bigram frequencies of a list of words.
 
-        # Store frequencies of letters and bigrams (combos of two letters)
-        letters = {}
-        bigrams = {}
-
-        # Loop through each letter of each word
-        for word in words:
-            for c in word:
-                if c in letters.keys():
-                    letters[c] += 1
-                else:
-                    letters[c] = 1
-
-            for i in range(len(word) - 1):
-                bigram = str(word[i] + word[i + 1])
-                if bigram in bigrams.keys():
-                    bigrams[bigram] += 1
-                else:
-                    bigrams[bigram] = 1
-
-        numwords = len(words)
-        letters = {k: v / numwords for k, v in letters.items()}
-        bigrams = {k: v / numwords for k, v in bigrams.items()}
-
-        sorted_letters = letters
-        sorted_bigrams = bigrams
-
-        self.letter_prob = sorted_letters
-        self.bigram_prob = sorted_bigrams
+        Every table is a few array operations on the letter array of the words,
+        the dicts are kept for anything that looks up a single letter or bigram.
+        """
+        letters = Utils.words_to_array(words)
+        positional, bigram_counts = self.count_letters(letters)
+        self.calc_stats_from_counts(positional, bigram_counts, letters.shape[0])
 
-    def calc_in_word_stats(self, words):
+    @staticmethod
+    def count_letters(letters) -> tuple:
+        """ The raw counts behind the stats of a letter array.
+
+        Counts of separate chunks of words add up, so the stats of a word list too big to hold at once
+        can be built a chunk at a time with `calc_stats_from_counts`.
+
+        Args:
+            letters: (N x word length) letter array, from `Utils.words_to_array`
+
+        Returns:
+            (positional, bigram_counts): the (word length x 26) letter counts at each position,
+            and the (26 x 26) bigram counts
+
+        """
+        positional = np.stack([np.bincount(letters[:, p], minlength=26) for p in range(letters.shape[1])])
+        bigram_codes = letters[:, :-1].astype(np.intp) * 26 + letters[:, 1:]
+        bigram_counts = np.bincount(bigram_codes.ravel(), minlength=26 * 26).reshape(26, 26)
+        return positional, bigram_counts
+
+    def calc_stats_from_counts(self, positional, bigram_counts, numwords: int):
+        """ Calculate the stats from the counts of `count_letters`
+        """
+        self.num_words = numwords
+        if numwords == 0:
+            self.letter_prob, self.bigram_prob = {}, {}
+            self.positional_prob = np.zeros(positional.shape)
+            self.bigram_table = np.zeros((26, 26))
+            return
 
         # Store frequencies of letters and bigrams (combos of two letters)
-        alphabet = 'abcdefghijklmnopqrstuvwxyz'
-        letters = {l:0 for l in alphabet}
-        for letter in alphabet:
-            for word in words:
-                if letter in word:
-                    letters[letter] += 1
-
+        letter_counts = positional.sum(axis=0)
+        self.positional_prob = positional / numwords
+        self.bigram_table = bigram_counts / numwords
+        self.letter_prob = {ALPHABET[i]: int(v) / numwords for i, v in enumerate(letter_counts) if v}
+        self.bigram_prob = {ALPHABET[i // 26] + ALPHABET[i % 26]: int(v) / numwords
+                            for i, v in enumerate(bigram_counts.ravel()) if v}
 
-        numwords = len(words)
-        letters = {k: v / numwords for k, v in letters.items()}
-        for k, v in letters.items():
-            if v == 1.0:
-                letters[k] = 0
-        return letters
+    def calc_in_word_stats(self, words):
+        """ The fraction of words each letter appears in, letters that are in every word get 0
+        since they can't tell the words apart.
+        """
+        letters = Utils.words_to_array(words)
+        numwords = letters.shape[0]
+        if numwords == 0:
+            return {l: 0 for l in ALPHABET}
+        # document frequency: the number of words each letter is in, counted once per word
+        in_word = np.zeros((numwords, 26), dtype=bool)
+        in_word[np.arange(numwords)[:, None], letters] = True
+        frequency = in_word.sum(axis=0) / numwords
+        frequency[frequency == 1.0] = 0
+        return {l: float(v) for l, v in zip(ALPHABET, frequency)}
 
     def get_letter_prob(self, letter: str):
         return self.letter_prob[letter]
@@ -85,6 +119,59 @@ class LetterStats:
         return sum([self.get_letter_prob(w) for w in word])
 
 
+class LetterCountTracker:
+    """ Keeps the in-word letter counts of the remaining words up to date as they get filtered down.
+
+    The remaining words only ever shrink during a game, so rather than recounting them every turn,
+    the words that were removed are counted and subtracted, unless there are fewer words left than
+    were removed, in which case it's cheaper to recount what's left.
+
+    """
+
+    def __init__(self, index):
+        """
+        Args:
+            index: the `Index.WordIndex` the tracked bitsets are from
+        """
+        self.index = index
+        self.bits = 0
+        self.num_words = 0
+        self.counts = np.zeros(26, dtype=np.int64)
+
+    def _count(self, bits: int):
+        from src import Index
+
+        return self.index.present[Index.bits_to_mask(bits, len(self.index.words))].sum(axis=0)
+
+    def update(self, bits: int) -> None:
+        """ Move the counts to a new set of remaining words
+
+        Args:
+            bits: the bitset of the remaining words
+        """
+        from src import Index
+
+        is_subset = self.bits and (bits & ~self.bits) == 0
+        removed = self.bits & ~bits
+        n_removed = Index.count(removed) if is_subset else 0
+        if is_subset and n_removed <= self.num_words - n_removed:
+            self.counts -= self._count(removed)
+        elif bits != self.bits:
+            self.counts = self._count(bits)
+
+        self.bits = bits
+        self.num_words = Index.count(bits)
+
+    def in_word_stats(self) -> dict:
+        """ The same stats as `LetterStats.calc_in_word_stats`, for the tracked words
+        """
+        if self.num_words == 0:
+            return {l: 0 for l in ALPHABET}
+        frequency = self.counts / self.num_words
+        frequency[frequency == 1.0] = 0
+        return {l: float(v) for l, v in zip(ALPHABET, frequency)}
+
+
 class WordStats:
     def __init__(self, letter_prob, bigram_prob):
         self.letter_prob = letter_prob
@@ -94,17 +181,111 @@ class WordStats:
         for word, num in zip(sorted_words, sorted_match_num):
             print(f"Word {word} Total Matches:  {num}")
 
-    def find_best_guess(self, full_word_list, current_possible_words):
-        word_dict = {w: 0 for w in full_word_list}
-        for i,word in enumerate(full_word_list):
-            print(f"processing {i}")
-            shared_letter_rating = self.process_word(word, current_possible_words)
-            word_dict[word] = shared_letter_rating
+    def find_best_guess(self, full_word_list, current_possible_words, quiet: bool = False, budget: float = None):
+        """ Rate every word by how many of the possible words share all, or all but one, of its letters
+
+        Args:
+            full_word_list: the words to rate as guesses
+            current_possible_words: the words that are still possible
+            quiet: if True, don't print the rating of every word at the end
+            budget: the most seconds to spend rating, past it only the words rated so far are ranked
+                (see `rate_words`).  None rates every word.
+
+        Returns:
+            (words, ratings): the 10 best rated words and their ratings, best last
+
+        """
+        word_dict = {}
+        for word_dict in self.rate_words(full_word_list, current_possible_words, budget):
+            pass
 
         sorted_match_num, sorted_words = zip(*sorted(zip(word_dict.values(), word_dict.keys())))
-        self.debug_print(sorted_match_num, sorted_words)
+        if not quiet:
+            self.debug_print(sorted_match_num, sorted_words)
         return sorted_words[-10:], sorted_match_num[-10:]
 
+    def iter_best_guesses(self, full_word_list, current_possible_words, budget: float = None, k: int = 10):
+        """ Yields the k best (words, ratings) of the words rated so far, best last, as `rate_words` goes
+        """
+        for word_dict in self.rate_words(full_word_list, current_possible_words, budget):
+            sorted_match_num, sorted_words = zip(*sorted(heapq.nlargest(k, zip(word_dict.values(), word_dict.keys()))))
+            yield sorted_words, sorted_match_num
+
+    def rate_words(self, full_word_list, current_possible_words, budget: float = None):
+        """ Rate the words a chunk at a time, most promising first, and yield the {word: rating} of every word
+        rated so far after each chunk.  Stops early once the budget (seconds) has passed, the first chunk is
+        always rated.  If the budget runs out while the possible words are still being counted, the words are
+        rated against the ones counted so far.
+
+        The most promising words are the ones whose distinct letters are in the most possible words, since
+        words sharing letters with many of the possible words get the best ratings.
+        """
+        deadline = None if budget is None else time.perf_counter() + budget
+        current_possible_words = list(current_possible_words)
+        full_word_list = list(full_word_list)
+        length = len(full_word_list[0]) if full_word_list else Utils.WORD_LENGTH
+        words_with_letter = Utils.letter_presence(Utils.words_to_array(current_possible_words, length)).sum(axis=0)
+        promise = (Utils.letter_presence(Utils.words_to_array(full_word_list, length)).astype(np.float32)
+                   @ words_with_letter.astype(np.float32))
+        order = np.argsort(-promise, kind="stable")
+
+        # The possible words are counted in interleaved parts, so if time runs out part way the words are rated
+        # against an even sample of the possible words rather than the first few alphabetically.
+        signature_counts = Counter()
+        n_parts = max(1, -(-len(current_possible_words) // SIGNATURE_CHUNK_SIZE))
+        for part in range(n_parts):
+            self.count_signatures(current_possible_words[part::n_parts], signature_counts)
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        word_dict = {}
+        for start in range(0, len(order), RATE_CHUNK_SIZE):
+            for i in order[start:start + RATE_CHUNK_SIZE]:
+                word = full_word_list[i]
+                word_dict[word] = self.process_word_signatures(word, signature_counts)
+            yield word_dict
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+
+    @staticmethod
+    def letter_signature(counted_letters: dict) -> int:
+        """ Pack a {letter: count} dict into an int, with SIGNATURE_BITS per letter.
+
+        Only letters with a non zero count take part, so the signature identifies both
+        which letters are in the subset and how many of each.
+        """
+        return sum(count << (SIGNATURE_BITS * (ord(letter) - ord("a"))) for letter, count in counted_letters.items())
+
+    def count_signatures(self, word_list, signatures: Counter = None) -> Counter:
+        """ Count the signature of every subset of distinct letters of every word, adding to `signatures` if given.
+
+        A word matches a letter subset (with counts) when it has exactly that many of each letter in the subset,
+        which is the same as the word's counts restricted to those letters having the same signature.
+        Each word has at most 2^length - 1 subsets, so this is one small pass over the words, and after that
+        the number of words matching any subset is a single lookup.
+
+        Returns:
+            a Counter of {signature: number of words with that signature}
+
+        """
+        if signatures is None:
+            signatures = Counter()
+        for word in word_list:
+            fields = [self.letter_signature({letter: count}) for letter, count in Counter(word).items()]
+            for n_letters in range(1, len(fields) + 1):
+                for subset in combinations(fields, n_letters):
+                    signatures[sum(subset)] += 1
+        return signatures
+
+    def process_word_signatures(self, word, signature_counts: Counter):
+        """ Same rating as `process_word`, but matching subsets by signature instead of rescanning the word list
+        """
+        words_with_letter_subset = {k: 0 for k in list(range(1, len(word) + 1))}
+        for subset in self.all_subsets(word):
+            signature = self.letter_signature(Counter(subset))
+            words_with_letter_subset[len(subset)] += signature_counts[signature]
+        return self.calc_stats(words_with_letter_subset)
+
     def process_word(self, word, word_list):
         #sorted_letters = self.sort_letters_by_prob(word)
         words_with_common_letters = self.find_words_with_common_letters(word, word_list)
@@ -112,7 +293,7 @@ class WordStats:
         return shared_letter_rating
 
     def find_words_with_common_letters(self, sorted_letters, word_list):
-        words_with_letter_subset = {k: 0 for k in list(range(1, 6))}
+        words_with_letter_subset = {k: 0 for k in list(range(1, len(sorted_letters) + 1))}
         for subset in self.all_subsets(sorted_letters):
             n_letters = len(subset)
             if n_letters == 0:
@@ -132,8 +313,8 @@ class WordStats:
     # This gets a bit beyond my understanding of python, but I timed it compared to another method, and it's faster.
     @staticmethod
     def all_subsets(ss):
-        # Skip single letters, that's kinda useless.
-        return chain(*map(lambda x: combinations(ss, x), range(4, len(ss) + 1)))
+        # Skip single letters, that's kinda useless.  Only the subsets missing at most one letter are kept.
+        return chain(*map(lambda x: combinations(ss, x), range(max(len(ss) - 1, 1), len(ss) + 1)))
 
     def calc_stats(self, words_with_common_letters):
         total_matches = 0
@@ -0,0 +1,158 @@
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from src import Utils, Profile
+
+log = logging.getLogger()
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_PATH = Utils.cache_dir / "suggestions.db"
+
+# Entries kept on disk, the least recently used past this are deleted every PRUNE_EVERY writes.
+DEFAULT_MAX_DISK_ENTRIES = 1_000_000
+PRUNE_EVERY = 1000
+
+# How long a writer waits for another process's write to finish before giving up.
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suggestions (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS suggestions_used ON suggestions (used);
+"""
+
+
+class SuggestionCache:
+    """ A bounded LRU cache of suggestions, shared by every session in the process.
+
+    Keys are strings that identify everything the suggestions depend on (see `Session.Session.cache_key`),
+    values are anything JSON-able.  Once `max_entries` are cached, the least recently used entry is dropped.
+
+    With a disk path (see `spill_to`), every entry is also written to a SQLite file, and a miss in memory is
+    looked up there, so entries outlive eviction and the process, and several processes can share them.
+    Values read back from disk come back as JSON does, ex: lists rather than tuples.
+
+    ex:
+        value = shared_cache.get(key)
+        if value is None:
+            value = compute()
+            shared_cache.put(key, value)
+        print(shared_cache.report())
+
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, path: Path = None,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.path = None
+        self._connection = None
+        self._writes = 0
+        if path is not None:
+            self.spill_to(path)
+
+    def spill_to(self, path: Path = DEFAULT_PATH) -> None:
+        """ Also keep every entry in a SQLite file, shared with any other process using the same file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # sessions on other threads share the connection, it's only used under the lock
+        self._connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def get(self, key: str):
+        """ The cached value, or None
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                Profile.count("suggestion_cache.hits")
+                return self.entries[key]
+
+            value = self._read(key)
+            if value is None:
+                self.misses += 1
+                Profile.count("suggestion_cache.misses")
+                return None
+            self.disk_hits += 1
+            Profile.count("suggestion_cache.disk_hits")
+            self._remember(key, value)
+            return value
+
+    def put(self, key: str, value) -> None:
+        with self.lock:
+            self._remember(key, value)
+            self._write(key, value)
+
+    def _remember(self, key: str, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _read(self, key: str):
+        if self._connection is None:
+            return None
+        row = self._connection.execute("SELECT value FROM suggestions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute("UPDATE suggestions SET used = ? WHERE key = ?", (self._tick(), key))
+        return json.loads(row[0])
+
+    def _write(self, key: str, value) -> None:
+        if self._connection is None:
+            return
+        self._connection.execute("INSERT OR REPLACE INTO suggestions (key, value, used) VALUES (?, ?, ?)",
+                                 (key, json.dumps(value, separators=(",", ":")), self._tick()))
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self._connection.execute("DELETE FROM suggestions WHERE key IN "
+                                     "(SELECT key FROM suggestions ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                                     (self.max_disk_entries,))
+
+    def _tick(self) -> int:
+        # a counter shared by every process using the file, so "least recently used" holds across them
+        row = self._connection.execute("SELECT COALESCE(MAX(used), 0) + 1 FROM suggestions").fetchone()
+        return row[0]
+
+    def clear(self) -> None:
+        """ Forget everything, in memory and on disk, and reset the stats
+        """
+        with self.lock:
+            self.entries.clear()
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM suggestions")
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "disk_hits": self.disk_hits,
+                "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"suggestion cache: {stats['hit_rate']:.1%} hit rate, {stats['hits']} hits, "
+                f"{stats['disk_hits']} from disk, {stats['misses']} misses, {stats['entries']} entries, "
+                f"{stats['evictions']} evicted")
+
+
+# The cache every session shares unless it's given its own, in memory only until `spill_to` is called.
+shared_cache = SuggestionCache()
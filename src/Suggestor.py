@@ -1,17 +1,137 @@
 
-from src import Stats
+import logging
+import multiprocessing
+import time
+
+import numpy as np
+
+from src import Utils, Stats, Patterns, Profile
+
+log = logging.getLogger()
+
+# Scoring modes:
+#   heuristic: letter frequency of the remaining words, only suggests remaining words
+#   entropy: expected information (bits) of the feedback, over every allowed guess
+#   expected_size: expected number of words eliminated by the feedback, over every allowed guess
+#   lookahead: expected number of guesses to solve, searching a couple of guesses ahead (see `Solver`)
+MODES = ("heuristic", "entropy", "expected_size", "lookahead")
+
+# Number of patterns counted at once, as (guesses x remaining words).  Small chunks keep the temporary
+# arrays in cache, but at least CHUNK_SIZE guesses are counted at once to limit the python overhead.
+CHUNK_ELEMENTS = 100_000
+CHUNK_SIZE = 16
+
+# Up to this many remaining words, only the patterns that show up are counted rather than all 3^length per guess.
+SPARSE_LIMIT = 64
+
+# From this many patterns (guesses x remaining words) on, a suggestor with processes > 1 scores on its worker
+# pool (see `Parallel`), below it handing out the work costs more than it saves.
+PARALLEL_MIN_ELEMENTS = 1 << 22
+
+# While refining suggestions within a time budget, about this many patterns are scored between looks at the clock.
+REFINE_ELEMENTS = 1 << 20
+
+
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int):
+    """ The k best (ids, scores), best last.  Equal scores are ordered by id, so the result doesn't depend on
+    the order of the ids, or on how they were split up to be scored.
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return ids[:0], scores[:0]
+    top = np.flatnonzero(scores >= np.partition(scores, -k)[-k])
+    top = top[np.lexsort((ids[top], scores[top]))][-k:]
+    return ids[top], scores[top]
 
 
 class Suggestor:
-    def __init__(self):
+    def __init__(self, mode: str = "heuristic", num_to_return: int = 20, length: int = Utils.WORD_LENGTH,
+                 processes: int = 1, pattern_matrix: Patterns.PatternMatrix = None):
+        """
+        Args:
+            mode: how guesses are ranked, one of MODES
+            num_to_return: the number of suggestions
+            length: the word length
+            processes: worker processes to score the guesses on, 1 scores in this process
+            pattern_matrix: the pattern matrix to score with, defaults to the shared one for the word length
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown suggestion mode {mode}, expected one of {MODES}")
+        self.mode = mode
+        self.num_to_return = num_to_return
+        self.length = length
+        self.processes = processes
+        self.pattern_matrix = pattern_matrix
         self.stats = Stats.LetterStats()
+        self.solver = None
+        self.parallel = None
         #self.wstats = Stats.WordStats()
 
-    def suggest(self, current_possible_words, unknown_letters):
-        letter_stats = self.stats.calc_in_word_stats(current_possible_words)
-        print(f"e stats: {letter_stats['e']}")
-        guesses = self.find_best_guesses(current_possible_words, letter_stats, unknown_letters)
-        return guesses
+    def suggest(self, current_possible_words, unknown_letters, letter_stats=None, guesses=None, budget: float = None):
+        """ Suggest the next guesses
+
+        Args:
+            current_possible_words: the words that are still possible
+            unknown_letters: the letters that haven't been guessed yet
+            letter_stats: the in-word letter stats of the possible words, if they're already known
+                (ex: from a `Stats.LetterCountTracker`), otherwise they are calculated
+            guesses: the words allowed as guesses (ex: in hard mode), defaults to every word.
+                The heuristic only suggests possible words, which are always allowed.
+            budget: the most seconds to spend, the best suggestions found by then are returned
+                (see `iter_suggestions`).  None waits for the final ranking.
+
+        Returns:
+            (words, scores): the best guesses and their scores, best last
+
+        """
+        with Profile.phase(f"suggest.{self.mode}"):
+            if budget is not None:
+                suggestions = None
+                for suggestions in self.iter_suggestions(current_possible_words, unknown_letters, letter_stats,
+                                                         guesses, budget):
+                    pass
+                return suggestions
+            if self.mode == "lookahead":
+                return self.find_lookahead_guesses(current_possible_words, guesses)
+            if self.mode != "heuristic":
+                return self.find_most_informative_guesses(current_possible_words, guesses)
+            if letter_stats is None:
+                with Profile.phase("stats"):
+                    letter_stats = self.stats.calc_in_word_stats(current_possible_words)
+            log.debug("e stats: %s", letter_stats['e'])
+            guesses = self.find_best_guesses(current_possible_words, letter_stats, unknown_letters)
+            return guesses
+
+    def iter_suggestions(self, current_possible_words, unknown_letters, letter_stats=None, guesses=None,
+                         budget: float = None):
+        """ Yields better and better suggestions, as (words, scores) best last like `suggest`, until the ranking is
+        final or the time budget runs out.
+
+        The heuristic ranking is quick, and is the only one yielded.  The other modes first yield the allowed
+        guesses ranked by `guess_promise`, then score the guesses a chunk at a time, most promising first,
+        yielding the best guesses scored so far after each chunk.  Once every guess is scored the ranking is
+        the same as `suggest`.  The lookahead mode refines the entropy ranking this way, then runs its search
+        with the time left, yielding the guesses it finished searching (if any) when the search is cut short.
+
+        Args:
+            (see `suggest`)
+            budget: the most seconds to spend, None for no limit.  The first suggestions are always yielded.
+
+        """
+        deadline = None if budget is None else time.perf_counter() + budget
+        if self.mode == "heuristic":
+            if letter_stats is None:
+                letter_stats = self.stats.calc_in_word_stats(current_possible_words)
+            yield self.find_best_guesses(current_possible_words, letter_stats, unknown_letters)
+            return
+
+        ranker = self if self.mode != "lookahead" else Suggestor("entropy", self.num_to_return, self.length,
+                                                                 pattern_matrix=self.pattern_matrix)
+        yield from ranker.refine_informative_guesses(current_possible_words, guesses, deadline)
+        if self.mode == "lookahead" and (deadline is None or time.perf_counter() < deadline):
+            words, scores = self.find_lookahead_guesses(current_possible_words, guesses, deadline)
+            if words:
+                yield words, scores
 
     def find_best_guesses(self, full_word_list, letter_stats, unknown_letters):
         word_dict = {w: 0 for w in full_word_list}
@@ -27,8 +147,8 @@ class Suggestor:
         sorted_match_num, sorted_words = zip(*sorted(zip(word_dict.values(), word_dict.keys())))
         #return sorted_words, sorted_match_num
 
-        print(sorted_match_num[-1])
-        num_to_return = 20
+        log.debug("best rating: %s", sorted_match_num[-1])
+        num_to_return = self.num_to_return
         return sorted_words[-num_to_return:], sorted_match_num[-num_to_return:]
 
     def process_word(self, word, letter_stats):
@@ -41,4 +161,284 @@ class Suggestor:
         # Straight addition of word frequency
         # generally bad, words like "whooo" come up a lot just because
         # of vowel frequency.
-        return sum([letter_stats[word[i]] for i in range(len(word))])
\ No newline at end of file
+        return sum([letter_stats[word[i]] for i in range(len(word))])
+
+    @property
+    def patterns(self) -> Patterns.PatternMatrix:
+        """ The shared pattern matrix for the word length, unless the suggestor was given its own
+        """
+        if self.pattern_matrix is not None:
+            return self.pattern_matrix
+        return Patterns.get_pattern_matrix(self.length)
+
+    def to_words(self, ids: np.ndarray, scores: np.ndarray) -> tuple[tuple, tuple]:
+        """ (words, scores) from guess row indexes and their scores
+        """
+        return tuple(self.patterns.guesses[i] for i in ids), tuple(float(s) for s in scores)
+
+    def candidate_bonus(self, current_possible_words) -> np.ndarray:
+        """ A tiny bonus for every guess that could be the answer, by guess row index, to break ties in their favor
+        since they might win outright.
+        """
+        pattern_matrix = self.patterns
+        bonus = np.zeros(len(pattern_matrix.guesses))
+        bonus[[pattern_matrix.guess_index[w] for w in current_possible_words if w in pattern_matrix.guess_index]] = 1e-6
+        return bonus
+
+    def guess_promise(self, candidate_ids: np.ndarray, guess_ids: np.ndarray) -> np.ndarray:
+        """ A quick guess at how informative each guess is, to decide which guesses to score first.
+
+        Each letter splits the remaining words into those with and without it, a guess is rated by the summed
+        entropy (bits) of those splits over its distinct letters.  It ignores positions, so it's only an estimate.
+        """
+        pattern_matrix = self.patterns
+        p = (Utils.letter_counts(pattern_matrix.answer_letters[candidate_ids]) > 0).mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bits = np.nan_to_num(-(p * np.log2(p) + (1 - p) * np.log2(1 - p)))
+        return (Utils.letter_counts(pattern_matrix.guess_letters[guess_ids]) > 0) @ bits
+
+    def refine_informative_guesses(self, current_possible_words, guesses=None, deadline: float = None):
+        """ Yields the ranking of `find_most_informative_guesses` as it's worked out, see `iter_suggestions`
+
+        Args:
+            current_possible_words: the words that are still possible
+            guesses: the words allowed as guesses, defaults to every word
+            deadline: the `time.perf_counter` time to stop by, None for no limit
+
+        """
+        pattern_matrix = self.patterns
+        candidate_ids = pattern_matrix.answer_ids(current_possible_words)
+        guess_ids = np.arange(len(pattern_matrix.guesses)) if guesses is None else pattern_matrix.guess_ids(guesses)
+        bonus = self.candidate_bonus(current_possible_words)
+
+        promise = self.guess_promise(candidate_ids, guess_ids) + bonus[guess_ids]
+        yield self.to_words(*top_k(guess_ids, promise, self.num_to_return))
+
+        order = guess_ids[np.argsort(-promise, kind="stable")]
+        chunk_size = max(CHUNK_SIZE, REFINE_ELEMENTS // max(len(candidate_ids), 1))
+        ids, scores = np.empty(0, dtype=np.intp), np.empty(0)
+        for start in range(0, len(order), chunk_size):
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            rows = order[start:start + chunk_size]
+            ids, scores = top_k(np.concatenate([ids, rows]),
+                                np.concatenate([scores, self.score_all_guesses(candidate_ids, rows) + bonus[rows]]),
+                                self.num_to_return)
+            yield self.to_words(ids, scores)
+
+    def parallel_scorer(self):
+        """ The worker pool that scores guesses, started on first use, or None to score in this process
+        """
+        # pool workers are daemons and can't start pools of their own
+        if self.processes <= 1 or multiprocessing.current_process().daemon:
+            return None
+        if self.parallel is None:
+            # imported here since the workers score with a Suggestor
+            from src import Parallel
+
+            self.parallel = Parallel.ParallelScorer(self.mode, self.patterns, self.processes)
+        return self.parallel
+
+    def chunked_pattern_counts(self, candidate_ids: np.ndarray, guess_ids: np.ndarray = None):
+        """ Yields (first row, counts) for one chunk of guesses at a time, see `pattern_counts`.
+
+        Only one chunk of counts exists at once, so scoring a large dictionary stays in bounded memory.
+        """
+        pattern_matrix = self.patterns
+        n_patterns = pattern_matrix.n_patterns
+        n_guesses = len(pattern_matrix.guesses) if guess_ids is None else len(guess_ids)
+        chunk_size = max(CHUNK_SIZE, CHUNK_ELEMENTS // max(len(candidate_ids), 1))
+        for start in range(0, n_guesses, chunk_size):
+            rows = slice(start, start + chunk_size) if guess_ids is None else guess_ids[start:start + chunk_size]
+            patterns = pattern_matrix.block(rows, candidate_ids).astype(np.intp)
+            n_rows = patterns.shape[0]
+            patterns += n_patterns * np.arange(n_rows, dtype=np.intp)[:, None]
+            yield start, np.bincount(patterns.ravel(), minlength=n_rows * n_patterns).reshape(n_rows, -1)
+
+    def pattern_counts(self, candidate_ids: np.ndarray, guess_ids: np.ndarray = None) -> np.ndarray:
+        """ Count how many candidates give each feedback pattern, for every allowed guess.
+
+        Args:
+            candidate_ids: the column indexes of the remaining words in the pattern matrix
+            guess_ids: the row indexes of the allowed guesses, defaults to every row
+
+        Returns:
+            a (guesses x 3^length) array, where [g, p] is the number of candidates that give pattern p for guess g
+
+        """
+        pattern_matrix = self.patterns
+        n_guesses = len(pattern_matrix.guesses) if guess_ids is None else len(guess_ids)
+        counts = np.empty((n_guesses, pattern_matrix.n_patterns), dtype=np.int64)
+        for start, chunk in self.chunked_pattern_counts(candidate_ids, guess_ids):
+            counts[start:start + len(chunk)] = chunk
+        return counts
+
+    def count_weights(self, n_candidates: int) -> np.ndarray:
+        """ f(n) for every pattern count n from 0 to n_candidates, a guess is scored from the sum of f over its patterns
+        """
+        n = np.arange(n_candidates + 1, dtype=np.float64)
+        if self.mode == "entropy":
+            return n * np.log2(np.maximum(n, 1))
+        return n ** 2
+
+    def scores_from_sums(self, sums: np.ndarray, n_candidates: int) -> np.ndarray:
+        # no remaining words (sums are 0 too) scores 0 rather than 0 / 0
+        n = np.maximum(n_candidates, 1)
+        if self.mode == "entropy":
+            # H = log2(N) - sum(n * log2(n)) / N
+            return np.log2(n) - sums / n
+        # expected number of words left is sum(n^2) / N, so the expected number eliminated is N minus that
+        return n_candidates - sums / n
+
+    def score_guesses(self, counts: np.ndarray, n_candidates: int) -> np.ndarray:
+        """ Score every guess from its pattern counts, higher is better
+        """
+        return self.scores_from_sums(self.count_weights(n_candidates)[counts].sum(axis=1), n_candidates)
+
+    def score_all_guesses(self, candidate_ids: np.ndarray, guess_ids: np.ndarray = None) -> np.ndarray:
+        """ Score every allowed guess against the remaining words, higher is better
+
+        Args:
+            candidate_ids: the column indexes of the remaining words in the pattern matrix
+            guess_ids: the row indexes of the allowed guesses, defaults to every row
+
+        Returns:
+            the score of every guess, in pattern matrix order (or in the order of guess_ids)
+
+        """
+        n_candidates = len(candidate_ids)
+        weights = self.count_weights(n_candidates)
+        if n_candidates > SPARSE_LIMIT:
+            n_guesses = len(self.patterns.guesses) if guess_ids is None else len(guess_ids)
+            sums = np.empty(n_guesses)
+            for start, counts in self.chunked_pattern_counts(candidate_ids, guess_ids):
+                sums[start:start + len(counts)] = weights[counts].sum(axis=1)
+            return self.scores_from_sums(sums, n_candidates)
+
+        # A few remaining words only give a few of the possible patterns, so only count the patterns that show up.
+        n_patterns = self.patterns.n_patterns
+        patterns = self.patterns.block(slice(None) if guess_ids is None else guess_ids, candidate_ids).astype(np.intp)
+        n_guesses = patterns.shape[0]
+        patterns += n_patterns * np.arange(n_guesses, dtype=np.intp)[:, None]
+        unique, counts = np.unique(patterns.ravel(), return_counts=True)
+        sums = np.bincount(unique // n_patterns, weights=weights[counts], minlength=n_guesses)
+        return self.scores_from_sums(sums, n_candidates)
+
+    def find_most_informative_guesses(self, current_possible_words, guesses=None):
+        """ Rank every allowed guess by how much its feedback is expected to narrow down the remaining words.
+
+        Args:
+            current_possible_words: the words that are still possible
+            guesses: the words allowed as guesses, defaults to every word
+
+        Returns:
+            (words, scores): the top guesses and their scores, best last
+
+        """
+        pattern_matrix = self.patterns
+        candidate_ids = pattern_matrix.answer_ids(current_possible_words)
+        guess_ids = None if guesses is None else pattern_matrix.guess_ids(guesses)
+        all_ids = np.arange(len(pattern_matrix.guesses))
+        bonus = self.candidate_bonus(current_possible_words)
+
+        n_guesses = len(all_ids) if guess_ids is None else len(guess_ids)
+        parallel = self.parallel_scorer() if n_guesses * len(candidate_ids) >= PARALLEL_MIN_ELEMENTS else None
+        if parallel is not None:
+            ids, scores = parallel.top_guesses(candidate_ids, all_ids if guess_ids is None else guess_ids, bonus,
+                                               self.num_to_return)
+        elif guess_ids is None:
+            ids, scores = top_k(all_ids, self.score_all_guesses(candidate_ids) + bonus, self.num_to_return)
+        else:
+            scores = self.score_all_guesses(candidate_ids, guess_ids) + bonus[guess_ids]
+            ids, scores = top_k(guess_ids, scores, self.num_to_return)
+        return self.to_words(ids, scores)
+
+    def score_boards(self, board_candidate_ids: list, guess_ids: np.ndarray = None) -> np.ndarray:
+        """ Score every allowed guess against several boards at once, as the sum of its score on each board.
+
+        The remaining words of every board are gathered into one set of columns, and each board's patterns
+        are offset into their own 3^length counts, so the patterns of all the boards are counted in one pass.
+
+        Args:
+            board_candidate_ids: the column indexes of the remaining words, one array per board
+            guess_ids: the row indexes of the allowed guesses, defaults to every row
+
+        Returns:
+            the summed score of every guess, in pattern matrix order (or in the order of guess_ids)
+
+        """
+        pattern_matrix = self.patterns
+        n_boards = len(board_candidate_ids)
+        n_candidates = np.array([len(ids) for ids in board_candidate_ids])
+        columns = np.concatenate(board_candidate_ids)
+        board_offsets = np.repeat(pattern_matrix.n_patterns * np.arange(n_boards, dtype=np.intp), n_candidates)
+        weights = self.count_weights(int(n_candidates.max()))
+
+        n_guesses = len(pattern_matrix.guesses) if guess_ids is None else len(guess_ids)
+        sums = np.empty((n_guesses, n_boards))
+        row_size = n_boards * pattern_matrix.n_patterns
+        chunk_size = max(CHUNK_SIZE, CHUNK_ELEMENTS // max(len(columns), 1))
+        for start in range(0, n_guesses, chunk_size):
+            rows = slice(start, start + chunk_size) if guess_ids is None else guess_ids[start:start + chunk_size]
+            patterns = pattern_matrix.block(rows, columns).astype(np.intp)
+            n_rows = patterns.shape[0]
+            patterns += board_offsets
+            patterns += row_size * np.arange(n_rows, dtype=np.intp)[:, None]
+            counts = np.bincount(patterns.ravel(), minlength=n_rows * row_size).reshape(n_rows, n_boards, -1)
+            sums[start:start + n_rows] = weights[counts].sum(axis=2)
+        return self.scores_from_sums(sums, n_candidates).sum(axis=1)
+
+    def find_multi_board_guesses(self, boards, guesses=None):
+        """ Rank every allowed guess by its summed entropy (or expected size) over several boards.
+
+        The heuristic and lookahead modes don't apply to several boards, they are ranked by entropy.
+
+        Args:
+            boards: the words that are still possible, one list per unsolved board
+            guesses: the words allowed as guesses, defaults to every word
+
+        Returns:
+            (words, scores): the top guesses and their scores, best last
+
+        """
+        scorer = self if self.mode in ("entropy", "expected_size") else Suggestor("entropy", self.num_to_return,
+                                                                                   self.length,
+                                                                                   pattern_matrix=self.pattern_matrix)
+        pattern_matrix = self.patterns
+        guess_ids = None if guesses is None else pattern_matrix.guess_ids(guesses)
+        scores = scorer.score_boards([pattern_matrix.answer_ids(words) for words in boards], guess_ids)
+
+        # Break ties in favor of guesses that could solve a board, the more boards the better.
+        n_boards_possible = np.zeros(len(pattern_matrix.guesses))
+        for words in boards:
+            n_boards_possible[[pattern_matrix.guess_index[w] for w in words if w in pattern_matrix.guess_index]] += 1
+        if guess_ids is not None:
+            n_boards_possible = n_boards_possible[guess_ids]
+        scores = scores + 1e-6 * n_boards_possible
+
+        num_to_return = min(self.num_to_return, len(scores))
+        top = np.argpartition(scores, -num_to_return)[-num_to_return:]
+        top = top[np.argsort(scores[top], kind="stable")]
+        ids = top if guess_ids is None else guess_ids[top]
+        return tuple(pattern_matrix.guesses[i] for i in ids), tuple(float(scores[i]) for i in top)
+
+    def find_lookahead_guesses(self, current_possible_words, guesses=None, deadline: float = None):
+        """ Rank guesses by the expected number of guesses to solve, from a lookahead search.
+
+        Args:
+            current_possible_words: the words that are still possible
+            guesses: the words allowed as the next guess, defaults to every word
+            deadline: the `time.perf_counter` time to stop searching by, see `Solver.Solver.rank`
+
+        Returns:
+            (words, scores): the top guesses and 1 / expected number of guesses, so higher is still better, best last
+
+        """
+        # imported here since the solver ranks its own guesses with an entropy Suggestor
+        from src import Solver
+
+        if self.solver is None:
+            self.solver = Solver.Solver(processes=self.processes, length=self.length)
+        words, expected = self.solver.rank(current_possible_words, guesses, deadline)
+        words, expected = words[-self.num_to_return:], expected[-self.num_to_return:]
+        return words, tuple(1 / e for e in expected)
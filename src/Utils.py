@@ -1,89 +1,280 @@
 
-import copy
+import bz2
+import contextlib
+import gzip
+import hashlib
+import os
 from functools import cache
+from itertools import chain, compress, islice
 from pathlib import Path
+from typing import Iterable, Iterator
+
 import numpy as np
 
 data_dir = Path("data")
+# Files derived from the word lists, safe to delete, they are rebuilt as needed.
+cache_dir = data_dir / "cache"
+
+# The default word length, and the names of the word list files in `data_dir` for every length supported.
+WORD_LENGTH = 5
+WORD_LIST_NAMES = {4: "four", 5: "five", 6: "six", 7: "seven", 8: "eight"}
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+
+def display_choices(words, probs, replace: int = 0) -> int:
+    """ Print the words with a star rating, best last
 
-def display_choices(words, probs):
-    print(f'getting max of probs')
+    Args:
+        words: the words
+        probs: the rating of each word
+        replace: the number of lines printed by the last call, which are overwritten (on a terminal)
+
+    Returns:
+        the number of lines printed
+
+    """
     max_prob = max(probs)
     normalized = [p/max_prob * 10 for p in probs]
-    n_stars = np.round(normalized).astype(int)
+    n_stars = [round(n) for n in normalized]
     n_stars, words = zip(*sorted(zip(n_stars, words)))
 
+    if replace:
+        # move the cursor up to the start of the old lines and clear everything below it
+        print(f"\x1b[{replace}F\x1b[J", end="")
     for word, stars in zip(words, n_stars):
         print(f"{word} {'*'*stars}")
+    return len(words)
 
-@cache
-def get_words():
-    # Load the file.
-    with open(data_dir / "five-letter-words.txt", 'r') as f:
-        ## This includes \n at the end of each line:
-        # words = f.readlines()
+def word_list_path(length: int = WORD_LENGTH) -> Path:
+    """ The word list file for a word length, ex: data/five-letter-words.txt
+    """
+    if length not in WORD_LIST_NAMES:
+        raise ValueError(f"Unsupported word length {length}, expected one of {sorted(WORD_LIST_NAMES)}")
+    return data_dir / f"{WORD_LIST_NAMES[length]}-letter-words.txt"
+
+def available_lengths() -> list[int]:
+    """ The word lengths whose word list is in `data_dir`
+    """
+    return [length for length in sorted(WORD_LIST_NAMES) if word_list_path(length).exists()]
+
+def open_word_source(path) -> "Iterable[str]":
+    """ Open a word source as text, gzip (.gz) and bz2 (.bz2) files are decompressed as they're read
+    """
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rt")
+    return open(path, "r")
+
+
+def read_tokens(path) -> Iterator[str]:
+    """ Yields every whitespace separated token of a word source, one line at a time
+    """
+    with open_word_source(path) as f:
+        for line in f:
+            yield from line.split()
+
+
+def normalize_words(words: Iterable[str], length: int = None, alphabet: str = ALPHABET) -> Iterator[str]:
+    """ Lowercase words, and drop the ones that aren't `length` letters long or use letters outside the alphabet
+    """
+    allowed = frozenset(alphabet)
+    for word in words:
+        word = word.lower()
+        if (length is None or len(word) == length) and allowed.issuperset(word):
+            yield word
 
-        # This drops the \n at the end of each line:
-        words = f.read().splitlines()
 
-    return words
+def unique_words(words: Iterable[str]) -> Iterator[str]:
+    """ Drop repeated words, keeping the first of each.  Only the distinct words are remembered,
+    so memory grows with the size of the vocabulary rather than the size of the source.
+    """
+    seen = set()
+    for word in words:
+        if word not in seen:
+            seen.add(word)
+            yield word
+
+
+def stream_words(*sources, length: int = WORD_LENGTH, alphabet: str = ALPHABET, unique: bool = True) -> Iterator[str]:
+    """ The words of one or more sources (plain text, gzip or bz2, any number of words per line), cleaned up
+    one at a time so a source of any size can be read without loading it.
+
+    Args:
+        sources: the files to read, in order
+        length: only words of this many letters are kept, None keeps every length
+        alphabet: only words made of these letters are kept
+        unique: if True, only the first of any repeated word is kept
+
+    Returns:
+        a generator of lowercase words
+
+    """
+    words = normalize_words(chain.from_iterable(read_tokens(source) for source in sources), length, alphabet)
+    return unique_words(words) if unique else words
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """ Yields lists of up to `size` items at a time
+    """
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+@cache
+def get_words(length: int = WORD_LENGTH) -> tuple[str, ...]:
+    # A tuple, since it's cached and shared by every caller.
+    return tuple(stream_words(word_list_path(length), length=length))
 
 @cache
 def get_wordles():
-    with open( data_dir / 'updated_words.txt', 'r') as f:
-        ## This includes \n at the end of each line:
-        # words = f.readlines()
+    # imported here since the store uses Utils
+    from src import History
+
+    return History.get_store().words()
+
 
-        # This drops the \n at the end of each line:
-        words = f.read().lower().split()
+@contextlib.contextmanager
+def atomic_write(path: Path, mode: str = "w"):
+    """ Open a file to write, as a temporary file that replaces `path` once it is written and closed,
+    so other processes never load a partial file.  The parent directory is created if needed.
 
-    return words
+    ex:
+        with atomic_write(path, "wb") as f:
+            np.save(f, array)
 
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
-def add_wordle(new_word):
-    wordles = get_wordles()
-    if new_word in wordles:
+
+def word_list_hash(*word_lists) -> str:
+    """ A short, stable hash of one or more word lists, for keying things cached on disk
+    """
+    sha = hashlib.sha1()
+    for i, words in enumerate(word_lists):
+        if i:
+            sha.update(b"\0")
+        sha.update("\n".join(words).encode())
+    return sha.hexdigest()[:16]
+
+
+def words_to_array(words, length: int = WORD_LENGTH) -> np.ndarray:
+    """ Convert a list of words into an (N x word length) uint8 array of letter indexes (a=0 ... z=25)
+
+    Args:
+        words: the words to convert, all of the same length and lowercase a-z
+        length: the word length, only used for the shape of an empty list
+
+    Returns:
+        the letter array, one row per word.
+
+    """
+    words = list(words)
+    if not words:
+        return np.zeros((0, length), dtype=np.uint8)
+    joined = np.frombuffer("".join(words).encode("ascii"), dtype=np.uint8)
+    return (joined.reshape(len(words), -1) - ord("a")).astype(np.uint8)
+
+
+def letter_counts(letters: np.ndarray) -> np.ndarray:
+    """ Count how many times each letter appears in each word
+
+    Args:
+        letters: (N x word length) letter array from `words_to_array`
+
+    Returns:
+        an (N x 26) uint8 array, where [i, j] is the number of times letter j appears in word i
+
+    """
+    n_words = letters.shape[0]
+    offsets = letters.astype(np.intp) + 26 * np.arange(n_words, dtype=np.intp)[:, None]
+    return np.bincount(offsets.ravel(), minlength=26 * n_words).reshape(n_words, 26).astype(np.uint8)
+
+
+def letter_presence(letters: np.ndarray) -> np.ndarray:
+    """ Which letters appear in each word, cheaper than `letter_counts` when the counts don't matter
+
+    Args:
+        letters: (N x word length) letter array from `words_to_array`
+
+    Returns:
+        an (N x 26) bool array, where [i, j] is True if letter j is in word i
+
+    """
+    present = np.zeros((letters.shape[0], 26), dtype=bool)
+    present[np.arange(letters.shape[0])[:, None], letters] = True
+    return present
+
+
+def add_wordle(new_word, date: str = None):
+    """ Record a past wordle answer, ex: "2022-06-01" for the date, defaults to today
+    """
+    from src import History
+
+    if not History.get_store().add(new_word, date):
         print("Oopsie, this is already here")
-        return
 
-    with open(data_dir / 'updated_words.txt', 'a') as f:
-        f.write("\n" + new_word)
 
+@cache
+def get_filter_masks(length: int = WORD_LENGTH) -> dict[str, np.ndarray]:
+    """ The mask of words each dictionary filter keeps, computed once for the whole word list.
+
+    Wordle words are only ever true five letter words.
+    They are never plurals of four letter words,
+    Nor any modified version of shorter words, e.g.
+    time -> timed would never be used as it's the past tense of a four letter word.
+    These rules are based on observation and may not strictly apply to every game.
+
+    Each filter only depends on the word itself, so any combination of filters is the AND of their masks.
+
+    Args:
+        length: the word length of the word list
 
-def get_word_list(remove_previous_wordles=False, remove_plural=False, remove_past_tense=False, remove_un=False):
+    Returns:
+        {filter argument name of `get_word_list`: boolean mask over `get_words(length)` of the words it keeps}
 
-    wordles = copy.deepcopy(get_wordles())
-    words = copy.deepcopy(get_words())
-    # Wordle words are only ever true five letter words.
-    # They are never plurals of four letter words,
-    # Nor any modified version of shorter words, e.g.
-    # time -> timed would never be used as it's the past tense of a four letter word.
-    # These rules are based on observation and may not strictly apply to every game.
+    """
+    words = get_words(length)
+    wordles = set(get_wordles())
 
-    if remove_plural:
-        plural_wordles = [w for w in wordles if w.endswith('s')]
-        plural_words = [w for w in words if w.endswith('s')]
-        accepted_s_words = [w for w in plural_words if w in plural_wordles or w.endswith('ss')]
+    def mask(keep):
+        return np.fromiter((keep(w) for w in words), dtype=bool, count=len(words))
 
-        non_plurals = [w for w in words if w not in plural_words or w in accepted_s_words]
-        words = non_plurals
+    return {
+        # plurals are only kept if they've been a wordle before, or are "ss" words like "class"
+        "remove_plural": mask(lambda w: not w.endswith('s') or w in wordles or w.endswith('ss')),
+        # past tenses are only kept if they've been a wordle before, or are "eed" words like "breed"
+        "remove_past_tense": mask(lambda w: not w.endswith('ed') or w in wordles or w.endswith('eed')),
+        "remove_previous_wordles": mask(lambda w: w not in wordles),
+        "remove_un": mask(lambda w: not w.startswith("un")),
+    }
 
-    if remove_past_tense:
-        ed_wordles = [w for w in wordles if w.endswith('ed')]
-        ed_words = [w for w in words if w.endswith('ed')]
-        accepted_ed_words = [w for w in ed_words if w in ed_wordles or w.endswith('eed')]
-        non_eds = [w for w in words if w not in ed_words or w in accepted_ed_words]
-        words = non_eds
 
-    if remove_previous_wordles:
-        words = [w for w in words if w not in wordles]
-    
-    if remove_un:
-        words = [w for w in words if not w.startswith("un")]
+@cache
+def get_word_list(remove_previous_wordles=False, remove_plural=False, remove_past_tense=False, remove_un=False,
+                  length: int = WORD_LENGTH) -> tuple[str, ...]:
+    """ The word list with the requested filters applied.
 
-    
+    The result is cached for each combination of filters, and is a tuple so it can be shared safely.
+    """
+    flags = {"remove_previous_wordles": remove_previous_wordles, "remove_plural": remove_plural,
+             "remove_past_tense": remove_past_tense, "remove_un": remove_un}
+    words = get_words(length)
+    keep = np.ones(len(words), dtype=bool)
+    for name, mask in get_filter_masks(length).items():
+        if flags[name]:
+            keep &= mask
 
-    return words
+    return tuple(compress(words, keep))
 
 # words = get_words()
 # wordles = get_wordles()
@@ -3,6 +3,7 @@ from functools import cache
 from typing import Union
 
 import src.Rules as Rules
+from src import Profile
 
 import logging
 log = logging.getLogger()
@@ -22,11 +23,12 @@ code = Code()
 class WordGuess:
     """ a single guess, prompts the user to enter the letters and the tile colors of the guess
 
+    The letters and colors can also be passed in directly, in which case the user isn't prompted.
     """
 
-    def __init__(self):
-        self.letters = input("enter guess: ")
-        self.lvals = input("enter color: ")
+    def __init__(self, letters: str = None, lvals: str = None):
+        self.letters = input("enter guess: ") if letters is None else letters
+        self.lvals = input("enter color: ") if lvals is None else lvals
         if any([v not in Code.keys() for v in self.lvals]):
             print("Invalid colors:")
             print(
@@ -94,11 +96,12 @@ class GuessRules:
 
     def process_guess(self):
         self.rules = []
-        for letter in set(self.guess.letters):
-            self.update_correct_rules(letter)
-            self.update_present_rules(letter)
-            self.update_incorrect_rules(letter)
-        print(self.rules)
+        with Profile.phase("rules"):
+            for letter in set(self.guess.letters):
+                self.update_correct_rules(letter)
+                self.update_present_rules(letter)
+                self.update_incorrect_rules(letter)
+        log.debug("rules: %s", self.rules)
 
     def guess_to_rules(self, guess: WordGuess):
         self.update_guess(guess)